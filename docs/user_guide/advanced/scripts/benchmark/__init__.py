@@ -0,0 +1,4 @@
+from .headless import headless
+from .history import append_run, compare, load_history
+from .runner import measure, run
+from .workloads import WORKLOADS
@@ -0,0 +1,70 @@
+"""Benchmark the tutorial workloads.
+
+Usage:
+    python -m benchmark run --history history.json --label sapien-3.0.0
+    python -m benchmark run --history history.json --compare
+    python -m benchmark compare --history history.json --baseline 0 --current -1
+"""
+
+import argparse
+import sys
+
+from .history import append_run, compare, load_history, print_comparison
+from .runner import run
+from .workloads import WORKLOADS
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmark')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='measure workloads')
+    run_parser.add_argument('--workloads', nargs='+', choices=list(WORKLOADS), default=None)
+    run_parser.add_argument('--num-steps', type=int, default=10000)
+    run_parser.add_argument('--num-resets', type=int, default=1000)
+    run_parser.add_argument('--warmup-steps', type=int, default=100)
+    run_parser.add_argument('--repeats', type=int, default=3, help='keep the fastest of n repetitions')
+    run_parser.add_argument('--label', type=str, default=None, help='e.g., the SAPIEN release')
+    run_parser.add_argument('--history', type=str, default=None, help='append the run to a JSON history')
+    run_parser.add_argument('--compare', action='store_true', help='compare with the last run of the history')
+    run_parser.add_argument('--threshold', type=float, default=0.1)
+
+    compare_parser = subparsers.add_parser('compare', help='compare two runs of a history')
+    compare_parser.add_argument('--history', type=str, required=True)
+    compare_parser.add_argument('--baseline', type=int, default=-2, help='index of the baseline run')
+    compare_parser.add_argument('--current', type=int, default=-1, help='index of the current run')
+    compare_parser.add_argument('--threshold', type=float, default=0.1)
+
+    subparsers.add_parser('list', help='list workloads')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for name, fn in WORKLOADS.items():
+            print(f'{name:<12} {fn.__doc__}')
+        return 0
+
+    if args.command == 'run':
+        history = load_history(args.history) if args.history else []
+        current = run(args.workloads, args.num_steps, args.num_resets, args.warmup_steps, args.repeats,
+                      label=args.label)
+        if args.history:
+            append_run(args.history, current)
+        if not args.compare:
+            return 0
+        if not history:
+            print('No previous run to compare with')
+            return 0
+        baseline = history[-1]
+    else:
+        history = load_history(args.history)
+        baseline, current = history[args.baseline], history[args.current]
+
+    print(f'Baseline: {baseline["time"]} {baseline["label"] or ""} (SAPIEN {baseline["machine"]["sapien"]})')
+    print(f'Current:  {current["time"]} {current["label"] or ""} (SAPIEN {current["machine"]["sapien"]})')
+    rows = compare(baseline, current, threshold=args.threshold)
+    print_comparison(rows)
+    return 1 if any(row['regression'] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
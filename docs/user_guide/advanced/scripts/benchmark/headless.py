@@ -0,0 +1,61 @@
+"""Run tutorial code without a rendering device.
+
+Inside ``headless()``, ``sapien.Scene()`` only creates a PhysX system, and visual
+shapes and render materials are ignored. Collision shapes, and therefore the
+simulation, are unchanged.
+"""
+
+import contextlib
+
+import sapien
+import sapien.core
+from sapien.wrapper import actor_builder, urdf_loader
+
+_VISUAL_METHODS = [
+    'add_plane_visual',
+    'add_box_visual',
+    'add_capsule_visual',
+    'add_cylinder_visual',
+    'add_sphere_visual',
+    'add_visual_from_file',
+]
+
+
+class _NullRenderMaterial:
+    """Accept and ignore any render material parameter."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def _skip_visual(self, *args, **kwargs):
+    return self
+
+
+class _PhysxScene(sapien.Scene):
+    def __init__(self, systems=None):
+        if systems is None:
+            systems = [sapien.physx.PhysxCpuSystem()]
+        super().__init__(systems)
+
+
+@contextlib.contextmanager
+def headless():
+    patches = [(sapien, 'Scene', _PhysxScene),
+               (sapien.core, 'Scene', _PhysxScene),
+               (sapien.render, 'RenderMaterial', _NullRenderMaterial),
+               (urdf_loader, 'RenderMaterial', _NullRenderMaterial),
+               (urdf_loader, 'RenderTexture2D', _NullRenderMaterial)]
+    patches += [(actor_builder.ActorBuilder, name, _skip_visual) for name in _VISUAL_METHODS]
+
+    originals = [(obj, name, getattr(obj, name)) for obj, name, _ in patches]
+    for obj, name, value in patches:
+        setattr(obj, name, value)
+    try:
+        yield
+    finally:
+        for obj, name, value in originals:
+            setattr(obj, name, value)
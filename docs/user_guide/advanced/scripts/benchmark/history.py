@@ -0,0 +1,66 @@
+"""Keep a history of benchmark runs and compare runs."""
+
+import json
+import os
+
+# metric -> whether higher is better
+# Tail latencies (p99, max) are recorded but not compared, since they are too noisy
+METRICS = {
+    'steps_per_sec': True,
+    'resets_per_sec': True,
+    'latency_us.p50': False,
+}
+
+
+def load_history(path):
+    """Return the list of runs stored in a JSON history file."""
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)['runs']
+
+
+def append_run(path, run):
+    runs = load_history(path)
+    runs.append(run)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'runs': runs}, f, indent=2)
+    os.replace(tmp_path, path)  # never leave a truncated history behind
+
+
+def _get_metric(result, metric):
+    value = result
+    for key in metric.split('.'):
+        value = value.get(key) if value is not None else None
+    return value
+
+
+def compare(baseline, current, threshold=0.1, metrics=METRICS):
+    """Compare the results of two runs.
+
+    Returns:
+        list of dict: one row per workload and metric measured in both runs, with the
+        relative ``change`` (positive means better) and whether it is a ``regression``
+        (worse by more than ``threshold``).
+    """
+    rows = []
+    for name, result in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        for metric, higher_is_better in metrics.items():
+            old = _get_metric(baseline['results'][name], metric)
+            new = _get_metric(result, metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old if higher_is_better else (old - new) / old
+            rows.append({'workload': name, 'metric': metric, 'baseline': old, 'current': new,
+                         'change': change, 'regression': change < -threshold})
+    return rows
+
+
+def print_comparison(rows):
+    for row in rows:
+        flag = 'REGRESSION' if row['regression'] else ''
+        print(f'{row["workload"]:<12} {row["metric"]:<16} {row["baseline"]:>12.1f} -> {row["current"]:>12.1f} '
+              f'({row["change"]:+.1%}) {flag}')
@@ -0,0 +1,106 @@
+"""Measure the throughput and latency of workloads."""
+
+import datetime
+import gc
+import os
+import platform
+import time
+
+import numpy as np
+import sapien
+
+from .headless import headless
+from .workloads import WORKLOADS
+
+
+def measure(workload_fn, num_steps=10000, num_resets=1000, warmup_steps=100, repeats=3):
+    """Measure one workload.
+
+    Every step is timed separately. Resets triggered by the end of an episode are
+    not included in the step latencies. Resets are timed in a separate loop. Both
+    loops run ``repeats`` times and the fastest repetition is kept, as ``timeit``
+    does, since slower repetitions are caused by other processes.
+
+    Returns:
+        dict: ``steps_per_sec``, ``resets_per_sec``, ``latency_us`` (percentiles of the
+        step latency in microseconds) and ``setup_sec`` (time to create the workload).
+    """
+    clock = time.perf_counter_ns
+    with headless():
+        start = clock()
+        step, reset = workload_fn()
+        setup_ns = clock() - start
+
+        for _ in range(warmup_steps):
+            if step():
+                reset()
+
+        gc.collect()
+        gc.disable()  # keep garbage collection out of the latencies
+        try:
+            latencies, reset_ns = None, None
+            for _ in range(repeats):
+                samples = np.empty(num_steps, dtype=np.int64)
+                for i in range(num_steps):
+                    start = clock()
+                    done = step()
+                    samples[i] = clock() - start
+                    if done:
+                        reset()
+                if latencies is None or samples.sum() < latencies.sum():
+                    latencies = samples
+
+                start = clock()
+                for _ in range(num_resets):
+                    reset()
+                elapsed = clock() - start
+                reset_ns = elapsed if reset_ns is None else min(reset_ns, elapsed)
+        finally:
+            gc.enable()
+
+    percentiles = np.percentile(latencies, [50, 90, 99]) / 1e3
+    return {
+        'steps_per_sec': num_steps / (latencies.sum() / 1e9),
+        'resets_per_sec': num_resets / (reset_ns / 1e9) if num_resets else None,
+        'latency_us': {
+            'p50': float(percentiles[0]),
+            'p90': float(percentiles[1]),
+            'p99': float(percentiles[2]),
+            'max': float(latencies.max() / 1e3),
+        },
+        'setup_sec': setup_ns / 1e9,
+    }
+
+
+def machine_info():
+    return {
+        'sapien': sapien.__version__,
+        'numpy': np.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'hostname': platform.node(),
+    }
+
+
+def run(names=None, num_steps=10000, num_resets=1000, warmup_steps=100, repeats=3, label=None, verbose=True):
+    """Measure the given workloads (defaults to all) and return a run record."""
+    names = list(WORKLOADS) if names is None else names
+    results = {}
+    for name in names:
+        if name not in WORKLOADS:
+            raise NotImplementedError('Unsupported workload {}.'.format(name))
+        results[name] = measure(WORKLOADS[name], num_steps, num_resets, warmup_steps, repeats)
+        if verbose:
+            r = results[name]
+            print(f'{name:<12} {r["steps_per_sec"]:>10.0f} steps/s  {r["resets_per_sec"] or 0:>10.0f} resets/s  '
+                  f'p50 {r["latency_us"]["p50"]:>8.1f}us  p99 {r["latency_us"]["p99"]:>8.1f}us')
+    return {
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'label': label,
+        'machine': machine_info(),
+        'config': {'num_steps': num_steps, 'num_resets': num_resets, 'warmup_steps': warmup_steps,
+                   'repeats': repeats},
+        'results': results,
+    }
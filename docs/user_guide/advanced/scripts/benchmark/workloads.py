@@ -0,0 +1,221 @@
+"""Benchmark workloads built from the tutorial scripts.
+
+A workload is a function creating a simulation and returning ``(step, reset)``.
+``step()`` advances the simulation by one step of the tutorial loop and returns
+whether the episode is done. ``reset()`` restores the initial state.
+
+Workloads are created inside ``headless()``, so no rendering device is needed.
+"""
+
+import contextlib
+import importlib
+import os
+import sys
+
+import numpy as np
+import sapien
+
+USER_GUIDE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+GETTING_STARTED_DIR = os.path.join(USER_GUIDE_DIR, 'getting_started', 'scripts')
+ROBOTICS_DIR = os.path.join(USER_GUIDE_DIR, 'robotics', 'scripts')
+RL_DIR = os.path.join(USER_GUIDE_DIR, 'rl', 'scripts')
+
+
+def _import(directory, name):
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    return importlib.import_module(name)
+
+
+@contextlib.contextmanager
+def _cwd(directory):
+    # Some tutorial scripts load assets with paths relative to their directory
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+def _scene_workload(scene, step):
+    init_state = scene.physx_system.pack()
+    unpack = scene.physx_system.unpack
+
+    def step_fn():
+        step()
+        return False
+
+    def reset_fn():
+        unpack(init_state)
+
+    return step_fn, reset_fn
+
+
+def _env_workload(env, seed=0):
+    env.seed(seed)
+    np.random.seed(seed)  # LiftEnv uses the global generator
+    env.reset()
+    rng = np.random.default_rng(seed)
+    low, high = env.action_space.low, env.action_space.high
+    actions = rng.uniform(low, high, size=(1024,) + low.shape).astype(np.float32)
+    counter = [0]
+
+    def step_fn():
+        counter[0] += 1
+        _, _, done, _ = env.step(actions[counter[0] % len(actions)])
+        return done
+
+    return step_fn, env.reset
+
+
+# ---------------------------------------------------------------------------- #
+# Getting started
+# ---------------------------------------------------------------------------- #
+def hello_world():
+    """A box resting on the ground (hello_world.py)."""
+    scene = sapien.Scene()
+    scene.set_timestep(1 / 100.0)
+    scene.add_ground(altitude=0)
+    builder = scene.create_actor_builder()
+    builder.add_box_collision(half_size=[0.5, 0.5, 0.5])
+    builder.add_box_visual(half_size=[0.5, 0.5, 0.5], material=[1.0, 0.0, 0.0])
+    box = builder.build(name='box')
+    box.set_pose(sapien.Pose(p=[0, 0, 0.5]))
+    return _scene_workload(scene, scene.step)
+
+
+def contact():
+    """A box on a kinematic box, querying contacts at every step (contact.py)."""
+    scene = sapien.Scene()
+    scene.set_timestep(1 / 100.0)
+    builder = scene.create_actor_builder()
+    builder.add_box_collision(half_size=[0.5, 0.5, 0.5])
+    box1 = builder.build_kinematic(name='box1')
+    box1.set_pose(sapien.Pose(p=[0, 0, 1.0]))
+    builder = scene.create_actor_builder()
+    builder.add_box_collision(half_size=[0.25, 0.25, 0.25])
+    box2 = builder.build(name='box2')
+    box2.set_pose(sapien.Pose(p=[0, 0, 1.75]))
+
+    def step():
+        scene.step()
+        scene.get_contacts()
+
+    return _scene_workload(scene, step)
+
+
+def physics():
+    """A box sliding down a slope with the default arguments (physics.py)."""
+    from transforms3d.quaternions import axangle2quat
+    physics_py = _import(GETTING_STARTED_DIR, 'physics')
+
+    scene = sapien.Scene()
+    scene.set_timestep(1 / 100.0)
+    material = sapien.physx.PhysxMaterial(static_friction=0.3, dynamic_friction=0.3, restitution=0.1)
+    scene.add_ground(altitude=0, material=material)
+
+    half_size = [0.25, 0.5, 0.05]
+    angle = np.deg2rad(30.0)
+    slope_pose = sapien.Pose(
+        p=[0, 0, half_size[1] * np.sin(angle) + half_size[2] * np.cos(angle) + 0.1],
+        q=axangle2quat([1.0, 0.0, 0.0], angle),
+    )
+    physics_py.create_box(scene, slope_pose, half_size=half_size, color=[0.5, 0.5, 0.5],
+                          name='slope', is_kinematic=True, physical_material=material)
+    box_half_size = 0.05
+    box_pose = sapien.Pose(
+        p=[0,
+           (half_size[1] - box_half_size) * np.cos(angle) - (half_size[2] + box_half_size) * np.sin(angle),
+           (half_size[1] - box_half_size) * np.sin(angle) + (half_size[2] + box_half_size) * np.cos(angle)
+           + slope_pose.p[2]],
+        q=axangle2quat([1.0, 0.0, 0.0], angle),
+    )
+    physics_py.create_box(scene, box_pose, half_size=[box_half_size] * 3, color=[0., 0., 1.],
+                          physical_material=material, name='box')
+    return _scene_workload(scene, scene.step)
+
+
+def car():
+    """The toy car driving forward with gravity compensation (create_articulations.py)."""
+    create_articulations = _import(GETTING_STARTED_DIR, 'create_articulations')
+
+    scene = sapien.Scene()
+    scene.set_timestep(1 / 100.0)
+    scene.add_ground(altitude=0)
+    car = create_articulations.create_car(scene)
+    car.set_pose(sapien.Pose(p=[0., 0., 0.34]))
+    joints = create_articulations.get_joints_dict(car)
+    joints['front_shaft_joint'].set_drive_property(stiffness=1000.0, damping=0.0)
+    joints['front_gear'].set_drive_property(0.0, 1000.0)
+    joints['back_gear'].set_drive_property(0.0, 0.0)
+    joints['front_gear'].set_drive_velocity_target(5.0)
+
+    def step():
+        car.set_qf(car.compute_passive_force(True, True))
+        scene.step()
+
+    return _scene_workload(scene, step)
+
+
+# ---------------------------------------------------------------------------- #
+# Robotics
+# ---------------------------------------------------------------------------- #
+def pid():
+    """Jaco2 reaching a target with external PID controllers (pid.py)."""
+    pid_py = _import(ROBOTICS_DIR, 'pid')
+
+    scene = sapien.Scene()
+    scene.set_timestep(1 / 2000.0)
+    scene.add_ground(0)
+    loader = scene.create_urdf_loader()
+    loader.fix_root_link = True
+    robot = loader.load(os.path.join(USER_GUIDE_DIR, 'robotics', 'assets', 'jaco2', 'jaco2.urdf'))
+    robot.set_root_pose(sapien.Pose([0, 0, 0], [1, 0, 0, 0]))
+    robot.set_qpos([0, 3.14, 0, 3.14, 0, 3.14, 0] + [0] * 6)
+    target_qpos = np.array([4.71, 2.84, 0.0, 0.75, 4.62, 4.48, 4.88] + [0] * 6)
+    pid_parameters = [(40, 5, 2)] * 3 + [(20, 5.0, 2)] + [(5, 0.8, 2)] * 2 + [(5, 0.8, 0.4)] + [(0.1, 0, 0.02)] * 6
+    pids = [pid_py.SimplePID(*p) for p in pid_parameters]
+    dt = scene.get_timestep()
+
+    def step():
+        qf = robot.compute_passive_force(gravity=True, coriolis_and_centrifugal=True)
+        qf += pid_py.pid_forward(pids, target_qpos, robot.get_qpos(), dt)
+        robot.set_qf(qf)
+        scene.step()
+
+    step_fn, reset_fn = _scene_workload(scene, step)
+
+    def reset():
+        reset_fn()
+        pids[:] = [pid_py.SimplePID(*p) for p in pid_parameters]
+
+    return step_fn, reset
+
+
+# ---------------------------------------------------------------------------- #
+# Reinforcement learning
+# ---------------------------------------------------------------------------- #
+def ant():
+    """AntEnv with random actions."""
+    with _cwd(RL_DIR):
+        env = _import(RL_DIR, 'ant').AntEnv()
+    return _env_workload(env)
+
+
+def lift():
+    """LiftEnv with random actions."""
+    with _cwd(RL_DIR):
+        env = _import(RL_DIR, 'lift').LiftEnv()
+    return _env_workload(env)
+
+
+WORKLOADS = {
+    'hello_world': hello_world,
+    'contact': contact,
+    'physics': physics,
+    'car': car,
+    'pid': pid,
+    'ant': ant,
+    'lift': lift,
+}
@@ -0,0 +1,499 @@
+"""Asset baking.
+
+Concepts:
+    - Merge the visual meshes of a URDF file (e.g., a PartNet-Mobility object made of
+      dozens of OBJ, MTL and JPEG files) into a single binary file
+    - Store vertex and index buffers, the submesh ranges of every mesh file and
+      decoded textures, so loading reads one file and decodes nothing
+    - Load a URDF file with its baked file transparently, and share the render
+      resources of a baked file between copies of the object
+
+Usage:
+    python asset_bake.py ../assets/179/mobility.urdf  # writes ../assets/179/mobility.baked
+
+    use_baked_assets(scene)  # scene.create_urdf_loader() now uses the baked files
+    loader = scene.create_urdf_loader()
+"""
+
+import json
+import os
+import warnings
+import weakref
+
+import numpy as np
+import sapien
+from lxml import etree as ET
+from resource_cache import get_default_cache
+from sapien.wrapper.actor_builder import ActorBuilder
+from sapien.wrapper.articulation_builder import LinkBuilder
+from sapien.wrapper.urdf_loader import URDFLoader
+
+MAGIC = b'SAPIENBAKE\x00\x01'
+ALIGNMENT = 64
+
+
+def baked_path(urdf_file):
+    """Return the path of the baked file of a URDF file."""
+    return os.path.splitext(urdf_file)[0] + '.baked'
+
+
+# ---------------------------------------------------------------------------- #
+# Parsing OBJ and MTL files
+# ---------------------------------------------------------------------------- #
+def _parse_mtl(filename):
+    materials = {}
+    material = None
+    with open(filename) as f:
+        for line in f:
+            tokens = line.split()
+            if not tokens:
+                continue
+            key = tokens[0]
+            if key == 'newmtl':
+                material = materials[' '.join(tokens[1:])] = dict(
+                    base_color=[1.0, 1.0, 1.0, 1.0], specular=0.0, roughness=1.0, texture=None)
+            elif material is None:
+                continue
+            elif key == 'Kd':
+                material['base_color'][:3] = [float(x) for x in tokens[1:4]]
+            elif key == 'd':
+                material['base_color'][3] = float(tokens[1])
+            elif key == 'Tr':
+                material['base_color'][3] = 1.0 - float(tokens[1])
+            elif key == 'Ks':
+                material['specular'] = float(np.mean([float(x) for x in tokens[1:4]]))
+            elif key == 'Ns':
+                # Blinn-Phong exponent to GGX roughness
+                material['roughness'] = float(np.sqrt(2.0 / (float(tokens[1]) + 2.0)))
+            elif key == 'map_Kd':
+                material['texture'] = os.path.normpath(os.path.join(os.path.dirname(filename), tokens[-1]))
+    return materials
+
+
+def _parse_obj(filename):
+    """Return the submeshes of an OBJ file, one per material, and the MTL files it uses.
+
+    Lines are sorted by type in Python, and their numbers are parsed and processed
+    by NumPy. Negative indices are resolved against all the vertices of the file.
+    """
+    with open(filename, 'rb') as f:
+        lines = f.read().splitlines()
+    v, vt, vn = [], [], []
+    groups = {}  # material name -> face lines
+    mtl_files = []
+    faces = groups.setdefault(None, [])
+    for line in lines:
+        tokens = line.split(None, 1)
+        if len(tokens) < 2:
+            continue
+        key, values = tokens
+        if key == b'v':
+            v.append(values)
+        elif key == b'vn':
+            vn.append(values)
+        elif key == b'vt':
+            vt.append(values)
+        elif key == b'f':
+            faces.append(values)
+        elif key == b'usemtl':
+            faces = groups.setdefault(b' '.join(values.split()).decode(), [])
+        elif key == b'mtllib':
+            mtl_files.append(os.path.join(os.path.dirname(filename), b' '.join(values.split()).decode()))
+
+    positions = _parse_floats(v, 3)
+    uvs = _parse_floats(vt, 2)
+    normals = _parse_floats(vn, 3)
+
+    submeshes = []
+    for material, faces in groups.items():
+        if not faces:
+            continue
+        corners = _parse_faces(faces, (len(positions), len(uvs), len(normals)))
+        # One vertex per distinct (position, uv, normal), in the order of np.unique(corners, axis=0)
+        keys = ((corners[:, 0] + 1) * (len(uvs) + 1) + corners[:, 1] + 1) * (len(normals) + 1) + corners[:, 2] + 1
+        keys, first, indices = np.unique(keys, return_index=True, return_inverse=True)
+        unique = corners[first]
+        triangles = indices.reshape(-1, 3).astype(np.uint32)
+        vertices = positions[unique[:, 0]]
+        vertex_uvs = np.zeros((len(unique), 2), dtype=np.float32)
+        has_uv = unique[:, 1] >= 0
+        vertex_uvs[has_uv] = uvs[unique[has_uv, 1]]
+        vertex_uvs[:, 1] = 1 - vertex_uvs[:, 1]  # SAPIEN loads meshes with flipped UVs
+        if (unique[:, 2] >= 0).all():
+            vertex_normals = normals[unique[:, 2]]
+        else:
+            vertex_normals = _smooth_normals(vertices, triangles)
+        submeshes.append(dict(vertices=vertices, triangles=triangles, normals=vertex_normals,
+                              uvs=vertex_uvs, material=material))
+    return submeshes, mtl_files
+
+
+def _parse_floats(lines, columns):
+    if not lines:
+        return np.zeros((0, columns), dtype=np.float32)
+    values = np.array(b' '.join(lines).split(), dtype=np.float32)
+    if len(values) % len(lines):
+        # Lines with different numbers of values, e.g., optional w coordinates
+        return np.array([line.split()[:columns] for line in lines], dtype=np.float32).reshape(-1, columns)
+    return values.reshape(len(lines), -1)[:, :columns]
+
+
+def _parse_faces(lines, counts):
+    """Return the (position, uv, normal) indices of the corners of the fan-triangulated faces."""
+    tokens = b' '.join(lines).split()
+    num_corners = np.fromiter((len(line.split()) for line in lines), dtype=np.int64, count=len(lines))
+    slashes = np.fromiter((token.count(b'/') for token in tokens), dtype=np.int64, count=len(tokens))
+    k = slashes[0] + 1  # indices per corner
+    values = None
+    if (slashes == slashes[0]).all():
+        values = np.array(b' '.join(tokens).replace(b'//', b'/0/').replace(b'/', b' ').split(), dtype=np.int64)
+    if values is None or len(values) != len(tokens) * k:
+        # Faces with different formats (e.g., v/vt and v//vn), parsed one corner at a time
+        k = 3
+        values = np.array([[int(i) if i else 0 for i in (token.split(b'/') + [b'', b''])[:3]] for token in tokens],
+                          dtype=np.int64)
+    indices = np.full((len(tokens), 3), -1, dtype=np.int64)
+    values = values.reshape(-1, k)
+    # OBJ indices start at 1, negative indices count from the end, and 0 is a missing index
+    for i in range(k):
+        indices[:, i] = np.where(values[:, i] > 0, values[:, i] - 1,
+                                 np.where(values[:, i] < 0, counts[i] + values[:, i], -1))
+
+    num_triangles = num_corners - 2
+    face_start = np.cumsum(num_corners) - num_corners
+    face = np.repeat(np.arange(len(lines)), num_triangles)
+    i = np.arange(num_triangles.sum()) - np.repeat(np.cumsum(num_triangles) - num_triangles, num_triangles) + 1
+    first = face_start[face]
+    return indices[np.stack([first, first + i, first + i + 1], axis=1).reshape(-1)]
+
+
+def _smooth_normals(vertices, triangles):
+    a, b, c = (vertices[triangles[:, i]] for i in range(3))
+    face_normals = np.cross(b - a, c - a)
+    normals = np.zeros_like(vertices)
+    for i in range(3):
+        np.add.at(normals, triangles[:, i], face_normals)
+    norm = np.linalg.norm(normals, axis=1, keepdims=True)
+    return normals / np.where(norm > 0, norm, 1)
+
+
+def _load_texture(filename):
+    from PIL import Image
+
+    with Image.open(filename) as image:
+        return np.ascontiguousarray(image.convert('RGBA'))
+
+
+# ---------------------------------------------------------------------------- #
+# Baking
+# ---------------------------------------------------------------------------- #
+def bake(urdf_file, output=None):
+    """Bake the visual meshes of a URDF file into a single file.
+
+    Args:
+        urdf_file: the URDF file.
+        output: the baked file. Defaults to the URDF file with the ``.baked`` extension.
+
+    Returns:
+        str: the path of the baked file.
+    """
+    urdf_dir = os.path.dirname(os.path.abspath(urdf_file))
+    output = output or baked_path(urdf_file)
+    tree = ET.parse(urdf_file)
+    mesh_files = sorted({m.get('filename') for m in tree.iterfind('.//visual/geometry/mesh')})
+
+    arrays = {name: [] for name in ['vertices', 'normals', 'uvs', 'triangles']}
+    num_vertices = num_triangles = 0
+    meshes, submeshes, materials, textures, sources = {}, [], [], [], {}
+    material_ids, texture_ids = {}, {}
+
+    for mesh_file in mesh_files:
+        if not mesh_file.lower().endswith('.obj'):
+            continue  # other formats are loaded from their files
+        path = os.path.join(urdf_dir, mesh_file)
+        sources[path] = None
+        mesh_submeshes, mtl_files = _parse_obj(path)
+        mtl = {}
+        for mtl_file in mtl_files:
+            if os.path.isfile(mtl_file):
+                sources[mtl_file] = None
+                mtl.update(_parse_mtl(mtl_file))
+
+        mesh_file = os.path.relpath(path, urdf_dir).replace(os.sep, '/')
+        meshes[mesh_file] = []
+        for submesh in mesh_submeshes:
+            material = mtl.get(submesh['material'], dict(base_color=[1.0, 1.0, 1.0, 1.0], specular=0.0,
+                                                         roughness=1.0, texture=None))
+            texture = material['texture']
+            if texture is not None and texture not in texture_ids:
+                texture_ids[texture] = len(textures)
+                sources[texture] = None
+                arrays['texture_{}'.format(len(textures))] = [_load_texture(texture)]
+                textures.append('texture_{}'.format(len(textures)))
+            material = dict(material, texture=None if texture is None else texture_ids[texture])
+            key = json.dumps(material, sort_keys=True)
+            if key not in material_ids:
+                material_ids[key] = len(materials)
+                materials.append(material)
+
+            meshes[mesh_file].append(len(submeshes))
+            submeshes.append(dict(vertex_start=num_vertices, vertex_count=len(submesh['vertices']),
+                                  triangle_start=num_triangles, triangle_count=len(submesh['triangles']),
+                                  material=material_ids[key]))
+            for name in ['vertices', 'normals', 'uvs', 'triangles']:
+                arrays[name].append(submesh[name])
+            num_vertices += len(submesh['vertices'])
+            num_triangles += len(submesh['triangles'])
+
+    for path in sources:
+        st = os.stat(path)
+        sources[path] = [st.st_size, st.st_mtime_ns]
+    header = dict(meshes=meshes, submeshes=submeshes, materials=materials, textures=textures,
+                  sources={os.path.relpath(p, os.path.dirname(os.path.abspath(output))): s
+                           for p, s in sources.items()})
+    _write_arrays(output, header, {name: np.concatenate(a) if a else np.zeros((0, 3), np.float32)
+                                   for name, a in arrays.items()})
+    return output
+
+
+def _write_arrays(filename, header, arrays):
+    offset = 0
+    header['arrays'] = {}
+    for name, array in arrays.items():
+        header['arrays'][name] = [array.dtype.str, list(array.shape), offset]
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header_bytes = json.dumps(header).encode()
+    data_start = -(-(len(MAGIC) + 8 + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(header_bytes)).tobytes())
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(data_start + header['arrays'][name][2])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp, filename)
+
+
+# ---------------------------------------------------------------------------- #
+# Loading
+# ---------------------------------------------------------------------------- #
+class BakedAsset:
+    """The content of a baked file.
+
+    Render materials, textures and meshes are created on first use and shared by
+    all the objects loaded from the same baked file, while it stays in the
+    resource cache.
+    """
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            data = f.read()
+        if not data.startswith(MAGIC):
+            raise RuntimeError('{} is not a baked file.'.format(filename))
+        header_size = int(np.frombuffer(data, np.uint64, 1, len(MAGIC))[0])
+        header_start = len(MAGIC) + 8
+        header = json.loads(data[header_start:header_start + header_size])
+        data_start = -(-(header_start + header_size) // ALIGNMENT) * ALIGNMENT
+
+        self.filename = filename
+        self.root = os.path.dirname(os.path.abspath(filename))
+        self.meshes = header['meshes']
+        self.submeshes = header['submeshes']
+        self.sources = header['sources']
+        self._material_descs = header['materials']
+        self._texture_names = header['textures']
+        self.arrays = {}
+        for name, (dtype, shape, offset) in header['arrays'].items():
+            count = int(np.prod(shape))
+            self.arrays[name] = np.frombuffer(data, dtype, count, data_start + offset).reshape(shape)
+        self._materials = None
+        self._shapes = {}  # submesh index -> shape to clone
+        self._material_shapes = weakref.WeakKeyDictionary()  # given material -> {submesh index: shape}
+
+    def is_outdated(self):
+        """Whether a source file has changed since baking."""
+        for path, (size, mtime_ns) in self.sources.items():
+            try:
+                st = os.stat(os.path.join(self.root, path))
+            except OSError:
+                return True
+            if st.st_size != size or st.st_mtime_ns != mtime_ns:
+                return True
+        return False
+
+    def _create_materials(self):
+        textures = []
+        for name in self._texture_names:
+            array = self.arrays[name]
+            levels = int(np.log2(max(array.shape[:2]))) + 1
+            textures.append(sapien.render.RenderTexture2D(array, 'R8G8B8A8Unorm', mipmap_levels=levels, srgb=True))
+        return [render_material(desc, None if desc['texture'] is None else textures[desc['texture']])
+                for desc in self._material_descs]
+
+    def create_shapes(self, mesh_file, material=None):
+        """Return one render shape per submesh of a mesh file of the URDF.
+
+        The submeshes use their baked materials, or ``material`` (e.g., from the
+        URDF) if given. Shapes with a given material are only kept while the
+        material is alive.
+        """
+        if self._materials is None:
+            self._materials = self._create_materials()
+        shapes = self._shapes if material is None else self._material_shapes.setdefault(material, {})
+        clones = []
+        for i in self.meshes[mesh_file]:
+            shape = shapes.get(i)
+            if shape is None:
+                s = self.submeshes[i]
+                v = slice(s['vertex_start'], s['vertex_start'] + s['vertex_count'])
+                t = slice(s['triangle_start'], s['triangle_start'] + s['triangle_count'])
+                shape = shapes[i] = sapien.render.RenderShapeTriangleMesh(
+                    self.arrays['vertices'][v], self.arrays['triangles'][t], self.arrays['normals'][v],
+                    self.arrays['uvs'][v], material or self._materials[s['material']])
+            clones.append(shape.clone())
+        return clones
+
+
+def render_material(desc, texture=None):
+    """Create the render material of an MTL material."""
+    material = sapien.render.RenderMaterial(
+        base_color=desc['base_color'], specular=desc['specular'], roughness=desc['roughness'], metallic=0)
+    if texture is not None:
+        material.base_color_texture = texture
+    return material
+
+
+def load_baked_asset(filename):
+    """Return the BakedAsset of a file, or None if it does not exist or is outdated.
+
+    Baked assets are kept in the process-wide resource cache.
+    """
+    if not os.path.isfile(filename):
+        return None
+    cache = get_default_cache()
+    asset = cache.get('baked', filename)
+    if asset is None:
+        asset = BakedAsset(filename)
+        if asset.is_outdated():
+            warnings.warn('{} is outdated, bake it again. The source files are loaded instead.'.format(filename))
+            return None
+        cache.put('baked', filename, asset, os.path.getsize(filename))
+    return asset
+
+
+class BakedURDFLoader(URDFLoader):
+    """A URDF loader using the baked file next to the URDF file, if there is one.
+
+    Visual meshes found in the baked file are created from its buffers, and other
+    visual and collision shapes are loaded from their files as usual.
+    """
+
+    def parse(self, urdf_file, srdf_file=None, package_dir=None):
+        articulation_builders, actor_builders, cameras = super().parse(urdf_file, srdf_file, package_dir)
+        asset = load_baked_asset(baked_path(os.path.abspath(urdf_file)))
+        if asset is not None:
+            builders = actor_builders + [b for a in articulation_builders for b in a.link_builders]
+            for builder in builders:
+                for r in builder.visual_records:
+                    if r.type == 'file':
+                        mesh_file = os.path.relpath(r.filename, self.urdf_dir).replace(os.sep, '/')
+                        if mesh_file in asset.meshes:
+                            r.type = 'decoded'
+                            r.filename = mesh_file
+                            r.asset = asset
+                builder.__class__ = DECODED_BUILDERS[type(builder)]
+        return articulation_builders, actor_builders, cameras
+
+
+def create_urdf_loader(scene):
+    """Same as ``scene.create_urdf_loader()``, but returning a BakedURDFLoader."""
+    loader = BakedURDFLoader()
+    loader.set_scene(scene)
+    return loader
+
+
+def use_baked_assets(scene):
+    """Make ``scene.create_urdf_loader()`` return BakedURDFLoaders, so existing loading code uses baked files."""
+    scene.create_urdf_loader = lambda: create_urdf_loader(scene)
+    return scene
+
+
+class _DecodedBuilder:
+    """Create the ``decoded`` visual records from their decoded meshes, after the other records.
+
+    The ``asset`` of a decoded record creates its shapes with
+    ``create_shapes(filename, material)``.
+    """
+
+    def build_render_component(self):
+        records = self.visual_records
+        self.visual_records = [r for r in records if r.type != 'decoded']
+        try:
+            component = super().build_render_component()
+        finally:
+            self.visual_records = records
+
+        for r in records:
+            if r.type != 'decoded':
+                continue
+            for shape in r.asset.create_shapes(r.filename, r.material):
+                shape.local_pose = r.pose
+                shape.scale = r.scale
+                if r.scale[0] * r.scale[1] * r.scale[2] < 0:
+                    shape.set_front_face('clockwise')
+                shape.name = r.name
+                component.attach(shape)
+        return component
+
+
+class _DecodedActorBuilder(_DecodedBuilder, ActorBuilder):
+    pass
+
+
+class _DecodedLinkBuilder(_DecodedBuilder, LinkBuilder):
+    pass
+
+
+# Builder classes creating decoded records, by builder class
+DECODED_BUILDERS = {
+    ActorBuilder: _DecodedActorBuilder,
+    LinkBuilder: _DecodedLinkBuilder,
+    _DecodedActorBuilder: _DecodedActorBuilder,
+    _DecodedLinkBuilder: _DecodedLinkBuilder,
+}
+
+
+def main():
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('urdf', nargs='?', default='../assets/179/mobility.urdf')
+    parser.add_argument('--output', type=str, default=None)
+    parser.add_argument('--compare', action='store_true',
+                        help='compare the loading time with and without the baked file')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    output = bake(args.urdf, args.output)
+    asset = BakedAsset(output)
+    print(f'{output}: {len(asset.meshes)} meshes, {len(asset.submeshes)} submeshes, '
+          f'{len(asset._texture_names)} textures, {os.path.getsize(output) / 1e6:.1f} MB '
+          f'({time.perf_counter() - start:.2f} s)')
+
+    if args.compare:
+        for name, baked in [('URDFLoader', False), ('BakedURDFLoader', True)]:
+            scene = sapien.Scene()
+            if baked:
+                use_baked_assets(scene)
+            loader = scene.create_urdf_loader()
+            start = time.perf_counter()
+            loader.load(args.urdf)
+            print(f'{name}: {(time.perf_counter() - start) * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
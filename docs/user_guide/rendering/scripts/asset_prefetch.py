@@ -0,0 +1,239 @@
+"""Parallel asset prefetching.
+
+Concepts:
+    - Decode the mesh files and textures used by many actor builders on a thread pool
+    - Build the actors from the decoded arrays, so that building only creates the
+      render resources
+    - Decode every file once, even if it is used by many builders
+
+Usage:
+    prefetcher = AssetPrefetcher()
+    material = sapien.render.RenderMaterial()
+    prefetcher.set_texture(material, 'diffuse_texture', '../assets/aligned/table/texture.png')
+    builder = scene.create_actor_builder()
+    builder.add_visual_from_file('../assets/aligned/table/visual_mesh.obj', material=material)
+    prefetcher.prefetch([builder])  # decode the meshes and textures in parallel
+    table = builder.build()
+"""
+
+import os
+import threading
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+import sapien
+from asset_bake import DECODED_BUILDERS, _load_texture, _parse_mtl, _parse_obj, render_material
+from resource_cache import get_default_cache
+
+
+class AssetPrefetcher:
+    """Decode the files of actor and link builders before they are built.
+
+    ``prefetch(builders)`` decodes the OBJ files of the visual shapes added with
+    ``add_visual_from_file``, and the textures requested with ``set_texture``, on
+    a thread pool. The visual shapes are then created from the decoded arrays when
+    the builders are built. Other mesh formats are loaded from their files as usual.
+
+    Decoded meshes and textures are kept in a ``ResourceCache``, by default the
+    one shared by the whole process. Objects using the same file share the same
+    arrays, texture and meshes, and a file is only decoded again if it changes
+    or has been evicted. Decoded images waiting for their texture to be created
+    are kept in the cache as well, and dropped once the texture is created.
+
+    Args:
+        max_workers: the number of threads. Defaults to the number of CPUs.
+        cache: the resource cache. Defaults to ``get_default_cache()``.
+    """
+
+    def __init__(self, max_workers=None, cache=None):
+        self.executor = ThreadPoolExecutor(max_workers or os.cpu_count())
+        self.cache = cache or get_default_cache()
+        self._meshes = {}  # filename -> future of _DecodedMesh, while decoding
+        self._images = {}  # filename -> future of RGBA array, while decoding
+        self._pending = []  # (material, attribute, filename, srgb)
+        self._lock = threading.Lock()  # mesh decoding also requests textures
+
+    def _decode(self, kind, futures, filename, load_fn):
+        """Return a future of the resource of a file, from the cache or being decoded."""
+        resource = self.cache.get(kind, filename)
+        if resource is not None:
+            future = Future()
+            future.set_result(resource)
+            return future
+        with self._lock:
+            future = futures.get(filename)
+            if future is not None:
+                return future
+            future = futures[filename] = self.executor.submit(load_fn, filename)
+        # Outside the lock: the callback runs immediately if the future is already done
+        future.add_done_callback(lambda f: self._decoded(futures, filename, f))
+        return future
+
+    def _decoded(self, futures, filename, future):
+        with self._lock:
+            if futures.get(filename) is future:
+                del futures[filename]
+
+    def _decode_image(self, filename):
+        return self._decode('image', self._images, os.path.abspath(filename), self._load_image)
+
+    def _decode_texture(self, filename, srgb=True):
+        """Start decoding an image file, unless its texture is cached. Return the future of the image, or None."""
+        if self.cache.contains('texture', filename, (srgb,)):
+            return None
+        return self._decode_image(filename)
+
+    def _decode_mesh(self, filename):
+        return self._decode('mesh', self._meshes, os.path.abspath(filename), self._load_mesh)
+
+    def _load_image(self, filename):
+        array = _load_texture(filename)
+        return self.cache.put('image', filename, array, array.nbytes)
+
+    def _load_mesh(self, filename):
+        submeshes, mtl_files = _parse_obj(filename)
+        mtl = {}
+        for mtl_file in mtl_files:
+            if os.path.isfile(mtl_file):
+                mtl.update(_parse_mtl(mtl_file))
+        for desc in mtl.values():
+            if desc['texture'] is not None:
+                self._decode_texture(desc['texture'])
+        mesh = _DecodedMesh(submeshes, mtl)
+        return self.cache.put('mesh', filename, mesh, mesh.nbytes)
+
+    def texture(self, filename, srgb=True):
+        """Return the texture of an image file, decoded on the thread pool if it is not cached."""
+        texture = self.cache.get('texture', filename, (srgb,))
+        if texture is None:
+            array = self._decode_image(filename).result()
+            texture = sapien.render.RenderTexture2D(array, 'R8G8B8A8Unorm', srgb=srgb)
+            self.cache.put('texture', filename, texture, array.nbytes, (srgb,))
+            self.cache.discard('image', filename)  # the decoded array is released once uploaded
+        return texture
+
+    def set_texture(self, material, name, filename, srgb=True):
+        """Set a texture of a render material (e.g., ``name='diffuse_texture'``) at the next ``prefetch``.
+
+        The image starts decoding immediately.
+        """
+        self._decode_texture(filename, srgb)
+        self._pending.append((material, name, filename, srgb))
+
+    def prefetch_files(self, mesh_files=(), image_files=()):
+        """Decode OBJ and image files, e.g., the assets of the next scene, and wait until they are decoded."""
+        futures = [self._decode_mesh(filename) for filename in mesh_files]
+        for filename in image_files:
+            future = self._decode_texture(filename)
+            if future is not None:
+                futures.append(future)
+        wait(futures)
+
+    def prefetch(self, builders):
+        """Decode the files used by builders, and wait until they are decoded.
+
+        Args:
+            builders: actor builders or link builders, not built yet.
+        """
+        records = []
+        for builder in builders:
+            for r in builder.visual_records:
+                if r.type == 'file' and r.filename.lower().endswith('.obj'):
+                    records.append((r, self._decode_mesh(r.filename)))
+            builder.__class__ = DECODED_BUILDERS[type(builder)]
+
+        pending, self._pending = self._pending, []
+        for material, name, filename, srgb in pending:
+            setattr(material, name, self.texture(filename, srgb))
+        for r, future in records:
+            if future.exception() is not None:
+                continue  # loaded from the file, which reports the error
+            r.type = 'decoded'
+            r.asset = future.result()
+            r.asset.create_materials(self.texture)
+
+    def close(self):
+        self.executor.shutdown()
+
+
+class _DecodedMesh:
+    """The submeshes of a decoded OBJ file and its render shapes, shared by all the builders using it.
+
+    The material of a render shape cannot be changed in SAPIEN 3.0.3, so the
+    submeshes are uploaded once for the materials of the MTL file, and once for
+    each material given to ``add_visual_from_file``. Shapes with the MTL
+    materials are counted in ``nbytes``. Shapes with a given material are only
+    kept while the material is alive, so the cache does not retain them.
+    """
+
+    def __init__(self, submeshes, mtl):
+        self.submeshes = submeshes
+        self.mtl = mtl
+        # The arrays, and their copy uploaded for the MTL materials
+        self.nbytes = 2 * sum(s[name].nbytes for s in submeshes for name in ['vertices', 'triangles', 'normals', 'uvs'])
+        self._materials = None  # MTL material name -> render material
+        self._shapes = None  # shapes to clone, with the MTL materials
+        self._material_shapes = weakref.WeakKeyDictionary()  # given material -> shapes to clone
+
+    def create_materials(self, texture_fn):
+        """Create the render materials of the MTL file, getting textures with ``texture_fn(filename)``."""
+        if self._materials is None:
+            self._materials = {
+                name: render_material(desc, None if desc['texture'] is None else texture_fn(desc['texture']))
+                for name, desc in self.mtl.items()
+            }
+
+    def _upload(self, material):
+        return [sapien.render.RenderShapeTriangleMesh(
+            s['vertices'], s['triangles'], s['normals'], s['uvs'],
+            material or self._materials.get(s['material']) or sapien.render.RenderMaterial())
+            for s in self.submeshes]
+
+    def create_shapes(self, filename, material=None):
+        if material is None:
+            if self._shapes is None:
+                self._shapes = self._upload(None)
+            shapes = self._shapes
+        else:
+            shapes = self._material_shapes.get(material)
+            if shapes is None:
+                shapes = self._material_shapes[material] = self._upload(material)
+        return [shape.clone() for shape in shapes]
+
+
+def main():
+    import argparse
+    import glob
+    import time
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--max-workers', type=int, default=None)
+    args = parser.parse_args()
+
+    # Decoding only, which does not need a rendering device
+    meshes = sorted(glob.glob('../assets/aligned/*/*.obj') + glob.glob('../assets/179/textured_objs/*.obj'))
+    images = sorted(glob.glob('../assets/aligned/*/*.png'))
+
+    start = time.perf_counter()
+    for filename in meshes:
+        _parse_obj(filename)
+    for filename in images:
+        _load_texture(filename)
+    print(f'serial: {time.perf_counter() - start:.3f} s')
+
+    prefetcher = AssetPrefetcher(args.max_workers)
+    start = time.perf_counter()
+    prefetcher.prefetch_files(meshes, images)
+    print(f'{prefetcher.executor._max_workers} threads: {time.perf_counter() - start:.3f} s')
+
+    # Meshes are now in the process-wide cache, e.g., for 100 copies of the same object
+    start = time.perf_counter()
+    for _ in range(100):
+        prefetcher.prefetch_files(meshes)
+    print(f'100 times from the cache: {time.perf_counter() - start:.3f} s')
+    print(prefetcher.cache.stats())
+    prefetcher.close()
+
+
+if __name__ == '__main__':
+    main()
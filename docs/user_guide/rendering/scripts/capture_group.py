@@ -0,0 +1,167 @@
+"""Pipelined multi-camera capture.
+
+Concepts:
+    - Submit the rendering of many cameras and depth sensors together
+    - Read the pictures back on a worker thread, so that reading back frame t
+      overlaps with simulating frame t + 1
+    - Return the pictures of a frame as a future
+
+Usage:
+    group = CaptureGroup(scene, picture_names=['Color', 'Position'])
+    for camera in cameras:
+        group.add_camera(camera)
+    for step in range(num_steps):
+        future = group.capture()  # renders the current state of the scene
+        scene.step()  # simulates the next frame during the readback
+        pictures = future.result()  # {camera name: {picture name: array}}
+"""
+
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from dataset_writer import sensor_frame
+
+
+class CaptureGroup:
+    """Render a group of cameras and depth sensors together, and read their pictures back asynchronously.
+
+    ``camera.take_picture()`` submits the rendering of a camera to the GPU, and
+    ``camera.get_picture()`` waits for the rendering and copies the picture to a
+    new array. Calling them one camera at a time makes every camera wait for the
+    previous one, and the simulation wait for all of them. ``capture`` instead
+    updates the render scene, submits all cameras and sensors at once, and reads
+    them back on a worker thread, while the caller continues the simulation.
+
+    The render scene must not be changed while the pictures are read back, so
+    ``capture`` first waits for the previous capture, and ``scene.update_render``
+    must not be called elsewhere while a capture is pending. Stepping the
+    simulation is safe: it only changes the render scene at the next
+    ``update_render``.
+
+    Args:
+        scene: the scene of the cameras and sensors.
+        picture_names: the pictures read from each camera, unless given to ``add_camera``.
+    """
+
+    def __init__(self, scene, picture_names=('Color',)):
+        self.scene = scene
+        self.picture_names = tuple(picture_names)
+        self.executor = ThreadPoolExecutor(1)  # readbacks of a device are serialized anyway
+        self._cameras = []  # (name, camera, picture names)
+        self._sensors = []  # (name, sensor)
+        self._future = None  # of the last capture
+
+    def add_camera(self, camera, picture_names=None):
+        """Add a camera, e.g., created by ``scene.add_camera`` or ``scene.add_mounted_camera``.
+
+        Its pictures are returned under ``camera.name``, which must be unique in the group.
+        """
+        self._check_name(camera.name)
+        self._cameras.append((camera.name, camera, tuple(picture_names or self.picture_names)))
+        return camera
+
+    def add_sensor(self, name, sensor):
+        """Add a StereoDepthSensor. Its RGB, infrared and depth images are returned under ``name``."""
+        self._check_name(name)
+        self._sensors.append((name, sensor))
+        return sensor
+
+    def _check_name(self, name):
+        if any(name == n for n, *_ in self._cameras + self._sensors):
+            raise RuntimeError('A camera or sensor named {} is already in the group.'.format(name))
+
+    def capture(self):
+        """Render the current state of the scene with all cameras and sensors.
+
+        Returns:
+            concurrent.futures.Future: the pictures as ``{name: {picture name: array}}``.
+        """
+        self.wait()
+        self.scene.update_render()
+        for _, camera, _ in self._cameras:
+            camera.take_picture()
+        for _, sensor in self._sensors:
+            sensor.take_picture()
+        self._future = self.executor.submit(self._read)
+        return self._future
+
+    def _read(self):
+        pictures = {}
+        for name, camera, picture_names in self._cameras:
+            pictures[name] = {picture_name: camera.get_picture(picture_name) for picture_name in picture_names}
+        for name, sensor in self._sensors:
+            sensor.compute_depth()
+            pictures[name] = sensor_frame(sensor)
+        return pictures
+
+    def wait(self):
+        """Wait until the last capture is read back. Its errors are raised by its future."""
+        if self._future is not None:
+            wait([self._future])
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def main():
+    import time
+    import numpy as np
+    import sapien
+
+    scene = sapien.Scene()
+    scene.add_ground(0)
+    loader = scene.create_urdf_loader()
+    loader.fix_root_link = True
+    loader.load("../assets/179/mobility.urdf")
+    for i in range(10):
+        builder = scene.create_actor_builder()
+        builder.add_box_collision(half_size=[0.05, 0.05, 0.05])
+        builder.add_box_visual(half_size=[0.05, 0.05, 0.05], material=[0.8, 0.2, 0.2])
+        builder.build().set_pose(sapien.Pose([0.1 * i - 0.5, -1, 1 + 0.2 * i]))
+    scene.set_ambient_light([0.5, 0.5, 0.5])
+    scene.add_directional_light([0, 1, -1], [0.5, 0.5, 0.5])
+
+    # A rig of 8 cameras around the object
+    cameras = []
+    for i, angle in enumerate(np.linspace(0, 2 * np.pi, 8, endpoint=False)):
+        camera = scene.add_camera(name=f"camera_{i}", width=640, height=480, fovy=np.deg2rad(35), near=0.1, far=100)
+        position = np.array([3 * np.cos(angle), 3 * np.sin(angle), 2])
+        forward = -position / np.linalg.norm(position)
+        left = np.cross([0, 0, 1], forward)
+        left = left / np.linalg.norm(left)
+        mat44 = np.eye(4)
+        mat44[:3, :3] = np.stack([forward, left, np.cross(forward, left)], axis=1)
+        mat44[:3, 3] = position
+        camera.entity.set_pose(sapien.Pose(mat44))
+        cameras.append(camera)
+    num_steps = 100
+
+    # One camera at a time
+    start = time.perf_counter()
+    for _ in range(num_steps):
+        scene.update_render()
+        pictures = {}
+        for camera in cameras:
+            camera.take_picture()
+            pictures[camera.name] = {'Color': camera.get_picture('Color')}
+        scene.step()
+    print(f'serialized: {(time.perf_counter() - start) / num_steps * 1000:.2f} ms per step')
+
+    with CaptureGroup(scene, picture_names=['Color']) as group:
+        for camera in cameras:
+            group.add_camera(camera)
+        start = time.perf_counter()
+        for _ in range(num_steps):
+            future = group.capture()
+            scene.step()
+            pictures = future.result()
+        print(f'pipelined: {(time.perf_counter() - start) / num_steps * 1000:.2f} ms per step')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""Sensor dataset writer.
+
+Concepts:
+    - Encode and write camera and depth sensor frames on a pool of worker threads,
+      so that image encoding does not serialize with rendering
+    - Write PNG images, compressed NPZ files or raw memory-mapped .npy shards
+    - Bound the number of frames waiting to be written (backpressure)
+    - Keep an append-only index of the frames on disk, so that a crash leaves
+      readable shards
+
+Layout of a dataset:
+    root/
+        index.jsonl                        # one JSON object per line, append-only
+        shard_000000/000000_color.png      # format='png': one image per frame and field
+        shard_000000/000000.npz            # format='npz': one compressed file per frame
+        shard_000000/color.npy             # format='raw': [shard_size, ...] per field
+
+Usage:
+    with SensorDatasetWriter('dataset', format='png') as writer:
+        for i in range(num_frames):
+            ...
+            camera.take_picture()
+            writer.write(camera_frame(camera), step=i)
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+FORMATS = ('png', 'npz', 'raw')
+
+
+def camera_frame(camera, visual_segmentation=False):
+    """Return the color, depth and segmentation pictures of a camera as a frame.
+
+    Depth is the distance along the camera axis in meters, and segmentation holds
+    the actor or link ids (and the visual shape ids if ``visual_segmentation``).
+    """
+    position = camera.get_picture('Position')
+    segmentation = camera.get_picture('Segmentation')
+    frame = dict(color=camera.get_picture('Color')[..., :3], depth=-position[..., 2],
+                 segmentation=segmentation[..., 1])
+    if visual_segmentation:
+        frame['visual_segmentation'] = segmentation[..., 0]
+    return frame
+
+
+def sensor_frame(sensor):
+    """Return the RGB, infrared and depth images of a StereoDepthSensor as a frame.
+
+    ``sensor.take_picture()`` and ``sensor.compute_depth()`` must be called first.
+    """
+    ir_l, ir_r = sensor.get_ir()
+    return dict(color=sensor.get_rgb(), ir_l=ir_l, ir_r=ir_r, depth=sensor.get_depth())
+
+
+class SensorDatasetWriter:
+    """Write frames of named arrays to a dataset from a pool of worker threads.
+
+    ``write`` only hands the arrays of a frame to the workers, which takes them
+    over: the arrays must not be modified afterwards (the pictures returned by a
+    camera are new arrays). At most ``max_pending_frames`` frames wait to be
+    written, so the memory usage is bounded.
+
+    Frames are grouped in shards of ``shard_size`` frames. A frame is added to the
+    index only once its data is on disk, so after a crash every indexed frame can
+    be read, including the frames of partial shards. Raw shards are memory-mapped
+    and flushed once complete, so their indexed frames survive a crash of the
+    process, but not necessarily of the system.
+
+    In PNG files, float images are stored as 8-bit images (values in [0, 1]),
+    except depth fields, which are stored as 16-bit images in units of
+    1 / ``depth_scale`` meters. Integer images (e.g., segmentation) are stored as
+    16-bit images. NPZ and raw shards store the arrays unchanged.
+
+    Args:
+        root: the directory of the dataset. It must not contain a dataset yet.
+        format: ``'png'``, ``'npz'`` or ``'raw'``.
+        shard_size: the number of frames per shard (directory, or .npy file for raw).
+        num_workers: the number of encoding threads. Defaults to the number of CPUs.
+        max_pending_frames: the number of frames waiting to be written.
+        on_full: what to do when ``max_pending_frames`` frames are waiting.
+            ``'block'`` waits for the workers. ``'drop'`` never stalls the caller:
+            the frame is discarded, and ``write`` returns None.
+        depth_fields: the names of the fields stored as depth in PNG files.
+        depth_scale: the PNG depth units per meter, e.g., 1000 for millimeters.
+    """
+
+    def __init__(self, root, format='png', shard_size=1000, num_workers=None, max_pending_frames=64,
+                 on_full='block', depth_fields=('depth',), depth_scale=1000.0):
+        assert format in FORMATS, 'Unsupported format: {}'.format(format)
+        assert on_full in ('block', 'drop'), 'Unsupported on_full: {}'.format(on_full)
+        os.makedirs(root, exist_ok=False)
+        self.root = root
+        self.format = format
+        self.shard_size = shard_size
+        self.on_full = on_full
+        self.depth_fields = tuple(depth_fields)
+        self.depth_scale = depth_scale
+
+        self.num_frames = 0  # frames accepted by write
+        self.num_dropped_frames = 0
+        self._slots = threading.BoundedSemaphore(max_pending_frames)
+        self._executor = ThreadPoolExecutor(num_workers or os.cpu_count())
+        self._lock = threading.Lock()
+        self._shards = {}  # shard id -> _Shard, while frames are being written
+        self._errors = []
+
+        self._index_file = open(os.path.join(root, 'index.jsonl'), 'a')
+        self._append_index(dict(type='dataset', format=format, shard_size=shard_size,
+                                depth_fields=list(self.depth_fields), depth_scale=depth_scale))
+
+    # ---------------------------------------------------------------------------- #
+    # Writing (calling thread)
+    # ---------------------------------------------------------------------------- #
+    def write(self, frame, **metadata):
+        """Queue a frame, a dict of named arrays, and return its id.
+
+        ``metadata`` (e.g., the step or the camera pose as a list) is stored in the
+        index with the frame. Returns None if the frame is dropped.
+        """
+        if self._errors:
+            raise RuntimeError('A frame could not be written.') from self._errors[0]
+        if not self._slots.acquire(blocking=self.on_full == 'block'):
+            self.num_dropped_frames += 1
+            return None
+
+        frame_id = self.num_frames
+        self.num_frames += 1
+        shard_id, slot = divmod(frame_id, self.shard_size)
+        with self._lock:
+            shard = self._shards.get(shard_id)
+            if shard is None:
+                shard = self._shards[shard_id] = _Shard(shard_id)
+            shard.num_frames += 1
+        self._executor.submit(self._write_frame, shard, frame_id, slot, frame, metadata)
+        return frame_id
+
+    def close(self):
+        """Write the remaining frames and partial shards, and wait for the workers."""
+        if self._executor is None:
+            return
+        with self._lock:
+            for shard in self._shards.values():
+                shard.closed = True  # the last shard is partial
+                if shard.num_frames == shard.num_written:
+                    self._executor.submit(self._finish_shard, shard)
+        self._executor.shutdown()
+        self._executor = None
+        self._index_file.close()
+        if self._errors:
+            raise RuntimeError('A frame could not be written.') from self._errors[0]
+
+    # ---------------------------------------------------------------------------- #
+    # Encoding (worker threads)
+    # ---------------------------------------------------------------------------- #
+    def _append_index(self, entry):
+        with self._lock:
+            self._index_file.write(json.dumps(entry) + '\n')
+            self._index_file.flush()
+
+    def _write_frame(self, shard, frame_id, slot, frame, metadata):
+        try:
+            frame = {name: np.asarray(array) for name, array in frame.items()}
+            if self.format == 'png':
+                files = self._write_png(shard, slot, frame)
+                self._append_index(dict(type='frame', id=frame_id, shard=shard.id, slot=slot, files=files,
+                                        metadata=metadata))
+            elif self.format == 'raw':
+                self._write_raw(shard, slot, frame)
+                self._append_index(dict(type='frame', id=frame_id, shard=shard.id, slot=slot, metadata=metadata))
+            else:
+                file = self._write_npz(shard, slot, frame)
+                self._append_index(dict(type='frame', id=frame_id, shard=shard.id, slot=slot, file=file,
+                                        metadata=metadata))
+        except Exception as e:
+            self._errors.append(e)
+        finally:
+            self._slots.release()
+            self._frame_written(shard)
+
+    def _frame_written(self, shard):
+        with self._lock:
+            shard.num_written += 1
+            finished = shard.num_written == (self.shard_size if not shard.closed else shard.num_frames)
+        if finished:
+            self._finish_shard(shard)
+
+    def _shard_path(self, shard_id):
+        return os.path.join(self.root, 'shard_{:06d}'.format(shard_id))
+
+    def _write_png(self, shard, slot, frame):
+        from PIL import Image
+
+        path = self._shard_path(shard.id)
+        os.makedirs(path, exist_ok=True)
+        files = {}
+        for name, array in frame.items():
+            if name in self.depth_fields:
+                image = np.clip(array * self.depth_scale, 0, 65535).astype(np.uint16)
+            elif np.issubdtype(array.dtype, np.floating):
+                image = (np.clip(array, 0, 1) * 255).astype(np.uint8)
+            elif array.dtype != np.uint8:
+                image = array.astype(np.uint16)
+            else:
+                image = array
+            filename = '{:06d}_{}.png'.format(slot, name)
+            tmp = os.path.join(path, filename + '.tmp')
+            Image.fromarray(image).save(tmp, format='PNG')
+            os.replace(tmp, os.path.join(path, filename))
+            files[name] = os.path.join(os.path.basename(path), filename)
+        return files
+
+    def _write_npz(self, shard, slot, frame):
+        path = self._shard_path(shard.id)
+        os.makedirs(path, exist_ok=True)
+        filename = '{:06d}.npz'.format(slot)
+        tmp = os.path.join(path, filename + '.tmp')
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(f, **frame)
+        os.replace(tmp, os.path.join(path, filename))
+        return os.path.join(os.path.basename(path), filename)
+
+    def _write_raw(self, shard, slot, frame):
+        with self._lock:
+            if shard.arrays is None:
+                # The arrays of a shard are created by its first frame
+                path = self._shard_path(shard.id)
+                os.makedirs(path, exist_ok=True)
+                shard.arrays = {
+                    name: np.lib.format.open_memmap(os.path.join(path, name + '.npy'), mode='w+',
+                                                    dtype=array.dtype, shape=(self.shard_size,) + array.shape)
+                    for name, array in frame.items()
+                }
+        for name, array in frame.items():
+            shard.arrays[name][slot] = array
+
+    def _finish_shard(self, shard):
+        with self._lock:
+            if shard.finishing:
+                return
+            shard.finishing = True
+        try:
+            if self.format == 'raw' and shard.arrays is not None:
+                for array in shard.arrays.values():
+                    array.flush()
+                shard.arrays = None
+            self._append_index(dict(type='shard', id=shard.id, length=shard.num_written))
+        except Exception as e:
+            self._errors.append(e)
+        finally:
+            with self._lock:
+                self._shards.pop(shard.id, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class _Shard:
+    def __init__(self, shard_id):
+        self.id = shard_id
+        self.num_frames = 0  # frames queued
+        self.num_written = 0  # frames written
+        self.closed = False  # no more frames will be queued
+        self.finishing = False
+        self.arrays = None  # name -> memmap, for raw
+
+
+class SensorDatasetReader:
+    """Read the frames of a dataset written by ``SensorDatasetWriter``.
+
+    Only the frames in the index are read, so a dataset whose writer crashed can
+    be read as well. PNG depth images are converted back to meters.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.frames = {}  # frame id -> index entry
+        with open(os.path.join(root, 'index.jsonl')) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # a line cut by a crash
+                if entry['type'] == 'dataset':
+                    self.info = entry
+                elif entry['type'] == 'frame':
+                    self.frames[entry['id']] = entry
+        self.frame_ids = sorted(self.frames)
+        self._shards = {}  # shard id -> arrays
+
+    def __len__(self):
+        return len(self.frame_ids)
+
+    def metadata(self, frame_id):
+        return self.frames[frame_id]['metadata']
+
+    def frame(self, frame_id):
+        """Return the arrays of a frame as a dict."""
+        entry = self.frames[frame_id]
+        if self.info['format'] == 'npz':
+            with np.load(os.path.join(self.root, entry['file'])) as data:
+                return dict(data)
+        if self.info['format'] == 'png':
+            from PIL import Image
+
+            frame = {}
+            for name, filename in entry['files'].items():
+                array = np.asarray(Image.open(os.path.join(self.root, filename)))
+                if name in self.info['depth_fields']:
+                    array = array.astype(np.float32) / self.info['depth_scale']
+                frame[name] = array
+            return frame
+
+        shard = self._shards.get(entry['shard'])
+        if shard is None:
+            path = os.path.join(self.root, 'shard_{:06d}'.format(entry['shard']))
+            shard = {name[:-4]: np.load(os.path.join(path, name), mmap_mode='r')
+                     for name in os.listdir(path) if name.endswith('.npy')}
+            self._shards[entry['shard']] = shard
+        return {name: array[entry['slot']] for name, array in shard.items()}
+
+
+def main():
+    import shutil
+    import tempfile
+    import time
+    import sapien
+    from PIL import Image
+
+    scene = sapien.Scene()
+    loader = scene.create_urdf_loader()
+    loader.fix_root_link = True
+    loader.load("../assets/179/mobility.urdf")
+    scene.set_ambient_light([0.5, 0.5, 0.5])
+    scene.add_directional_light([0, 1, -1], [0.5, 0.5, 0.5])
+
+    camera = scene.add_camera(name="camera", width=640, height=480, fovy=np.deg2rad(35), near=0.1, far=100)
+    camera.entity.set_pose(sapien.Pose([-2, -2, 3], [0.8483, -0.1516, 0.3661, 0.3514]))
+    num_frames = 50
+    root = tempfile.mkdtemp()
+
+    # As in camera.py, on the main thread
+    start = time.perf_counter()
+    for i in range(num_frames):
+        scene.update_render()
+        camera.take_picture()
+        frame = camera_frame(camera)
+        Image.fromarray((np.clip(frame['color'], 0, 1) * 255).astype(np.uint8)).save(f'{root}/color_{i}.png')
+        Image.fromarray((frame['depth'] * 1000.0).astype(np.uint16)).save(f'{root}/depth_{i}.png')
+        Image.fromarray(frame['segmentation'].astype(np.uint16)).save(f'{root}/segmentation_{i}.png')
+    print(f'main thread: {(time.perf_counter() - start) / num_frames * 1000:.2f} ms per frame')
+
+    for format in FORMATS:
+        start = time.perf_counter()
+        with SensorDatasetWriter(f'{root}/{format}', format=format, shard_size=20) as writer:
+            for i in range(num_frames):
+                scene.update_render()
+                camera.take_picture()
+                writer.write(camera_frame(camera), step=i)
+        print(f'{format}: {(time.perf_counter() - start) / num_frames * 1000:.2f} ms per frame')
+        reader = SensorDatasetReader(f'{root}/{format}')
+        assert len(reader) == num_frames
+        assert np.array_equal(reader.frame(num_frames - 1)['segmentation'], frame['segmentation'])
+    shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""Offline multi-view rendering of articulated assets.
+
+Concepts:
+    - Sample camera poses around an asset, on a sphere or jittered, and joint
+      configurations within the joint limits
+    - Render RGB, depth and segmentation with the intrinsics and extrinsics of every view
+    - Render many assets in worker processes, and resume an interrupted run
+
+Layout of the output:
+    output/
+        179/                               # one SensorDatasetWriter dataset per asset
+            index.jsonl                    # frames with their joint and camera parameters
+            asset.json                     # the links of the segmentation ids
+            shard_000000/000000_color.png
+        180.tmp/                           # an asset being rendered, discarded when resuming
+
+Usage:
+    python multiview_render.py ../assets/179/mobility.urdf --num-views 24 --num-qpos 4 --output renders
+"""
+
+import json
+import os
+import shutil
+import time
+import zlib
+
+import numpy as np
+import sapien
+
+from dataset_writer import SensorDatasetWriter, camera_frame
+
+
+def look_at(position, target=(0, 0, 0)):
+    """Return the pose of a camera at ``position`` looking at ``target``, with the z axis up."""
+    # Compute the camera pose by specifying forward(x), left(y) and up(z)
+    position = np.asarray(position, dtype=np.float64)
+    forward = np.asarray(target) - position
+    forward = forward / np.linalg.norm(forward)
+    left = np.cross([0, 0, 1], forward)
+    left = left / np.linalg.norm(left)
+    up = np.cross(forward, left)
+    mat44 = np.eye(4)
+    mat44[:3, :3] = np.stack([forward, left, up], axis=1)
+    mat44[:3, 3] = position
+    return sapien.Pose(mat44)
+
+
+def sample_camera_positions(num_views, radius, sampling='spherical', elevation=(10, 60), rng=None):
+    """Return [num_views, 3] camera positions around the origin.
+
+    Args:
+        num_views: the number of positions.
+        radius: the distance to the origin.
+        sampling: ``'spherical'`` for positions evenly spread over a band of the sphere
+            (a Fibonacci lattice), or ``'jittered'`` for one random position per sector
+            of azimuths, with random elevations and distances within 10% of ``radius``.
+        elevation: the range of elevations, in degrees.
+        rng: a numpy random generator, for ``'jittered'``.
+    """
+    i = np.arange(num_views)
+    low, high = np.sin(np.deg2rad(elevation))
+    if sampling == 'spherical':
+        z = low + (high - low) * (i + 0.5) / num_views
+        azimuth = i * np.pi * (3 - np.sqrt(5))  # the golden angle
+        distance = np.full(num_views, float(radius))
+    elif sampling == 'jittered':
+        z = rng.uniform(low, high, num_views)
+        azimuth = 2 * np.pi * (i + rng.random(num_views)) / num_views
+        distance = radius * rng.uniform(0.9, 1.1, num_views)
+    else:
+        raise NotImplementedError('Unsupported sampling {}.'.format(sampling))
+    horizontal = np.sqrt(1 - z ** 2)
+    return distance[:, None] * np.stack([horizontal * np.cos(azimuth), horizontal * np.sin(azimuth), z], axis=1)
+
+
+def sample_qpos(articulation, num_qpos, rng):
+    """Return [num_qpos, dof] joint positions: the rest configuration, then uniform samples within the limits.
+
+    Unlimited (e.g., continuous) joints are sampled within [-pi, pi].
+    """
+    limits = articulation.get_qlimits().astype(np.float64)
+    limits[~np.isfinite(limits).all(axis=1)] = [-np.pi, np.pi]
+    qpos = rng.uniform(limits[:, 0], limits[:, 1], (num_qpos, len(limits)))
+    if num_qpos > 0:
+        qpos[0] = np.clip(0, limits[:, 0], limits[:, 1])
+    return qpos
+
+
+def asset_name(urdf_file):
+    """Return the name of the output of an asset, e.g., ``'179'`` for ``179/mobility.urdf``."""
+    return os.path.basename(os.path.dirname(os.path.abspath(urdf_file)))
+
+
+def render_asset(urdf_file, output, num_views=24, num_qpos=4, sampling='spherical', radius=3.0,
+                 elevation=(10, 60), width=640, height=480, fovy=35, format='png', seed=0):
+    """Render the views of an asset to ``output/<asset name>``, unless they are already rendered.
+
+    The asset is rendered to ``<asset name>.tmp``, which is renamed once all views
+    are written, so an interrupted asset is rendered again from the start.
+
+    Returns:
+        int: the number of views rendered, 0 if the asset was already rendered.
+    """
+    name = asset_name(urdf_file)
+    path = os.path.join(output, name)
+    if os.path.isdir(path):
+        return 0
+    tmp = path + '.tmp'
+    if os.path.isdir(tmp):
+        shutil.rmtree(tmp)
+
+    scene = sapien.Scene()
+    loader = scene.create_urdf_loader()
+    loader.fix_root_link = True
+    articulation = loader.load(urdf_file)
+    if not articulation:
+        raise RuntimeError('Failed to load {}.'.format(urdf_file))
+    scene.set_ambient_light([0.5, 0.5, 0.5])
+    scene.add_directional_light([0, 1, -1], [0.5, 0.5, 0.5], shadow=True)
+    scene.add_point_light([1, 2, 2], [1, 1, 1])
+    scene.add_point_light([1, -2, 2], [1, 1, 1])
+    scene.add_point_light([-1, 0, 1], [1, 1, 1])
+    camera = scene.add_camera(name='camera', width=width, height=height, fovy=np.deg2rad(fovy), near=0.1, far=100)
+
+    # The samples of an asset do not depend on the other assets of the run
+    rng = np.random.default_rng([seed, zlib.crc32(name.encode())])
+    positions = sample_camera_positions(num_views, radius, sampling, elevation, rng)
+    qpos = sample_qpos(articulation, num_qpos, rng)
+
+    # Encoding overlaps with rendering the next views
+    with SensorDatasetWriter(tmp, format=format, shard_size=num_views * num_qpos) as writer:
+        for i, q in enumerate(qpos):
+            articulation.set_qpos(q)
+            for j, position in enumerate(positions):
+                camera.entity.set_pose(look_at(position))
+                scene.update_render()
+                camera.take_picture()
+                writer.write(camera_frame(camera), qpos_index=i, view_index=j, qpos=q.tolist(),
+                             intrinsic=camera.get_intrinsic_matrix().tolist(),
+                             extrinsic=camera.get_extrinsic_matrix().tolist(),
+                             model_matrix=camera.get_model_matrix().tolist())
+
+    links = {link.entity.per_scene_id: link.name for link in articulation.get_links()}
+    with open(os.path.join(tmp, 'asset.json'), 'w') as f:
+        json.dump(dict(urdf=os.path.abspath(urdf_file), joints=[j.name for j in articulation.get_active_joints()],
+                       links=links), f)
+    os.rename(tmp, path)
+    return len(qpos) * len(positions)
+
+
+def _render_job(job):
+    urdf_file, kwargs = job
+    start = time.perf_counter()
+    try:
+        return urdf_file, render_asset(urdf_file, **kwargs), time.perf_counter() - start, None
+    except Exception as e:
+        # A broken asset must not stop the run; it is rendered again when resuming
+        return urdf_file, 0, time.perf_counter() - start, repr(e)
+
+
+def main():
+    import argparse
+    import multiprocessing as mp
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('urdf', nargs='*', default=['../assets/179/mobility.urdf'])
+    parser.add_argument('--urdf-list', type=str, default=None, help='a file with one URDF path per line')
+    parser.add_argument('--output', type=str, default='renders')
+    parser.add_argument('--num-views', type=int, default=24)
+    parser.add_argument('--num-qpos', type=int, default=4)
+    parser.add_argument('--sampling', choices=['spherical', 'jittered'], default='spherical')
+    parser.add_argument('--radius', type=float, default=3.0)
+    parser.add_argument('--elevation', type=float, nargs=2, default=[10, 60])
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--fovy', type=float, default=35, help='in degrees')
+    parser.add_argument('--format', choices=['png', 'npz', 'raw'], default='png')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--num-workers', type=int, default=None)
+    args = parser.parse_args()
+
+    urdf_files = list(args.urdf)
+    if args.urdf_list is not None:
+        with open(args.urdf_list) as f:
+            urdf_files += [line.strip() for line in f if line.strip()]
+    names = [asset_name(urdf_file) for urdf_file in urdf_files]
+    if len(set(names)) != len(names):
+        raise RuntimeError('The assets must be in directories with different names.')
+
+    os.makedirs(args.output, exist_ok=True)
+    kwargs = dict(output=args.output, num_views=args.num_views, num_qpos=args.num_qpos, sampling=args.sampling,
+                  radius=args.radius, elevation=tuple(args.elevation), width=args.width, height=args.height,
+                  fovy=args.fovy, format=args.format, seed=args.seed)
+    # Completed assets are skipped, so an interrupted run is resumed by running it again
+    jobs = [(urdf_file, kwargs) for urdf_file, name in zip(urdf_files, names)
+            if not os.path.isdir(os.path.join(args.output, name))]
+    print(f'{len(urdf_files) - len(jobs)} of {len(urdf_files)} assets already rendered')
+    if not jobs:
+        return
+
+    num_workers = min(args.num_workers or mp.cpu_count(), len(jobs))
+    num_failed = 0
+    with mp.get_context('spawn').Pool(num_workers) as pool:
+        for k, (urdf_file, num_rendered, seconds, error) in enumerate(pool.imap_unordered(_render_job, jobs)):
+            if error is None:
+                print(f'[{k + 1}/{len(jobs)}] {urdf_file}: {num_rendered} views in {seconds:.1f} s')
+            else:
+                num_failed += 1
+                print(f'[{k + 1}/{len(jobs)}] {urdf_file}: failed, {error}')
+    if num_failed:
+        print(f'{num_failed} assets failed; run again to retry them')
+
+
+if __name__ == '__main__':
+    main()
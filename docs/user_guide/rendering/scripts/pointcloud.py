@@ -0,0 +1,293 @@
+"""Point cloud extraction.
+
+Concepts:
+    - Extract the world-frame positions, colors and segmentation ids of the valid
+      pixels of a camera in one call
+    - Write the points into buffers provided by the caller, without full-frame
+      temporaries, e.g., at every control step of a point-cloud policy
+    - Subsample the pixels with a stride, and keep only the points inside a box
+    - Downsample point clouds on a voxel grid, and sample a fixed number of points
+      with farthest point sampling or per segment
+
+Usage:
+    extractor = PointCloudExtractor(camera, stride=2, crop_box=([-1, -1, 0], [1, 1, 2]))
+    xyz, rgb, seg = extractor.allocate()
+    camera.take_picture()
+    n = extractor.extract(xyz, rgb, seg)  # the points are xyz[:n], rgb[:n] and seg[:n]
+    points, colors, labels = voxel_downsample(xyz[:n], 0.01, rgb[:n], seg[:n])
+    indices = farthest_point_sampling(points, 1024)  # always 1024 points
+"""
+
+import numpy as np
+
+
+class PointCloudExtractor:
+    """Extract the point cloud of a camera into preallocated buffers.
+
+    ``extract`` reads the "Position", "Color" and "Segmentation" pictures of the
+    camera, which must be taken with ``camera.take_picture()`` after
+    ``scene.update_render()``, and writes the points of the pixels within the far
+    plane (and the crop box) to the first rows of the buffers. The full-frame work
+    is done in buffers owned by the extractor, so repeated calls do not allocate
+    memory besides the pictures returned by the camera.
+
+    Args:
+        camera: a camera component.
+        stride: keep one pixel out of ``stride`` in each image dimension.
+        crop_box: if not None, (low, high) corners of an axis-aligned box in the
+            world frame; points outside the box are dropped.
+        segmentation_level: the channel of the segmentation picture to extract,
+            0 for visual shapes (mesh-level) and 1 for actors or links.
+    """
+
+    def __init__(self, camera, stride=1, crop_box=None, segmentation_level=1):
+        self.camera = camera
+        self.stride = stride
+        self.crop_box = None if crop_box is None else np.asarray(crop_box, dtype=np.float32).reshape(2, 3)
+        self.segmentation_level = segmentation_level
+
+        height = -(-camera.height // stride)
+        width = -(-camera.width // stride)
+        self.max_points = height * width
+        self._mask = np.empty((height, width), dtype=bool)
+        self._rows = np.empty((self.max_points, 4), dtype=np.float32)  # valid pixels of the position picture
+        self._scratch = np.empty((self.max_points, 3), dtype=np.float32)
+        self._keep = np.empty(self.max_points, dtype=bool)
+        self._inside = np.empty(self.max_points, dtype=bool)
+        if stride > 1:
+            # Strided pictures are copied to contiguous buffers, so they can be flattened without copies
+            self._position = np.empty((height, width, 4), dtype=np.float32)
+            self._color = np.empty((height, width, 4), dtype=np.float32)
+            self._segmentation = None  # allocated on first use, with the dtype of the picture
+
+    def allocate(self):
+        """Return new (xyz, rgb, seg) buffers that can hold the largest point cloud."""
+        return (np.empty((self.max_points, 3), dtype=np.float32),
+                np.empty((self.max_points, 3), dtype=np.float32),
+                np.empty(self.max_points, dtype=np.uint32))
+
+    def _picture(self, name, buffer_name):
+        picture = self.camera.get_picture(name)
+        if self.stride == 1:
+            return picture
+        buffer = getattr(self, buffer_name)
+        if buffer is None:
+            buffer = np.empty(self._mask.shape + picture.shape[2:], dtype=picture.dtype)
+            setattr(self, buffer_name, buffer)
+        np.copyto(buffer, picture[::self.stride, ::self.stride])
+        return buffer
+
+    def extract(self, xyz, rgb=None, seg=None):
+        """Write the points of the last picture of the camera, and return their number.
+
+        Args:
+            xyz: a (max_points, 3) float32 buffer for the positions in the world frame.
+            rgb: if not None, a (max_points, 3) float32 buffer for the colors in [0, 1].
+            seg: if not None, a (max_points,) integer buffer for the segmentation ids.
+
+        Returns:
+            int: the number of points n, written to the first n rows of the buffers.
+        """
+        position = self._picture('Position', '_position')
+        # Pixels with a depth of 1 are beyond the far plane
+        np.less(position[..., 3], 1, out=self._mask)
+        pixels = np.flatnonzero(self._mask)  # the only temporary, with one index per point
+        n = len(pixels)
+
+        # Transform the valid points from the OpenGL camera frame to the world frame. The rows
+        # are (x, y, z, depth), and the last row of the transform ignores the depth.
+        model_matrix = self.camera.get_model_matrix()
+        transform = np.zeros((4, 3), dtype=np.float32)
+        transform[:3] = model_matrix[:3, :3].T
+        # mode='clip' lets take write to its output directly
+        np.take(position.reshape(-1, 4), pixels, axis=0, out=self._rows[:n], mode='clip')
+        del position
+        np.matmul(self._rows[:n], transform, out=xyz[:n])
+        xyz[:n] += model_matrix[:3, 3].astype(np.float32)
+
+        if self.crop_box is not None:
+            keep, inside = self._keep[:n], self._inside[:n]
+            keep[:] = True
+            for i in range(3):
+                keep &= np.greater_equal(xyz[:n, i], self.crop_box[0, i], out=inside)
+                keep &= np.less_equal(xyz[:n, i], self.crop_box[1, i], out=inside)
+            kept = np.flatnonzero(keep)
+            n = len(kept)
+            np.take(xyz, kept, axis=0, out=self._scratch[:n], mode='clip')
+            xyz[:n] = self._scratch[:n]
+            pixels = pixels[kept]
+
+        if rgb is not None:
+            color = self._picture('Color', '_color')
+            np.take(color.reshape(-1, 4), pixels, axis=0, out=self._rows[:n], mode='clip')
+            del color
+            rgb[:n] = self._rows[:n, :3]
+        if seg is not None:
+            segmentation = self._picture('Segmentation', '_segmentation')
+            rows = self._rows.view(segmentation.dtype)  # the same scratch rows, reinterpreted
+            np.take(segmentation.reshape(-1, 4), pixels, axis=0, out=rows[:n], mode='clip')
+            seg[:n] = rows[:n, self.segmentation_level]
+        return n
+
+
+# ---------------------------------------------------------------------------- #
+# Post-processing
+# ---------------------------------------------------------------------------- #
+def crop(xyz, low, high):
+    """Return the indices of the points inside the axis-aligned box with corners ``low`` and ``high``."""
+    return np.flatnonzero(np.all((xyz >= np.asarray(low, dtype=xyz.dtype)) &
+                                 (xyz <= np.asarray(high, dtype=xyz.dtype)), axis=1))
+
+
+def voxel_downsample(xyz, voxel_size, rgb=None, seg=None):
+    """Replace the points of each voxel of a grid by their centroid.
+
+    The voxels are found by sorting a spatial hash of their integer coordinates,
+    which is exact for clouds spanning fewer than 2^21 voxels in each dimension.
+
+    Args:
+        xyz: a (n, 3) array of positions.
+        voxel_size: the edge length of the voxels.
+        rgb: if not None, a (n, 3) array of colors, averaged over each voxel.
+        seg: if not None, a (n,) array of segmentation ids. A voxel takes the id of one of its points.
+
+    Returns:
+        tuple: the (m, 3) positions, and the colors and segmentation ids (or None), in the order of the hash.
+    """
+    if len(xyz) == 0:
+        return xyz, rgb, seg
+    voxels = np.floor(xyz / voxel_size).astype(np.int64)
+    voxels -= voxels.min(axis=0)
+    if voxels.max() >= 1 << 21:
+        raise RuntimeError('The point cloud spans too many voxels of size {}.'.format(voxel_size))
+    keys = (voxels[:, 0] << 42) | (voxels[:, 1] << 21) | voxels[:, 2]
+    order = np.argsort(keys)
+    keys = keys[order]
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    counts = np.diff(np.append(starts, len(keys)))[:, None]
+
+    xyz = (np.add.reduceat(xyz[order], starts, axis=0) / counts).astype(xyz.dtype)
+    if rgb is not None:
+        rgb = (np.add.reduceat(rgb[order], starts, axis=0) / counts).astype(rgb.dtype)
+    if seg is not None:
+        seg = seg[order[starts]]
+    return xyz, rgb, seg
+
+
+def farthest_point_sampling(xyz, num_samples, start=0):
+    """Return the indices of ``num_samples`` points, each the farthest from the points before it.
+
+    The output has ``num_samples`` indices even if the cloud has fewer points, in
+    which case the points are repeated. The cost is proportional to
+    ``len(xyz) * num_samples``, so large clouds should be downsampled first,
+    e.g., with ``voxel_downsample``.
+
+    Args:
+        xyz: a (n, 3) array of positions, with n > 0.
+        num_samples: the number of indices.
+        start: the index of the first point.
+    """
+    n = len(xyz)
+    if n == 0:
+        raise RuntimeError('Cannot sample points from an empty point cloud.')
+    if n <= num_samples:
+        return np.resize(np.arange(n), num_samples)
+
+    indices = np.empty(num_samples, dtype=np.int64)
+    columns = np.ascontiguousarray(xyz.T)  # contiguous coordinates are faster to reduce than rows
+    min_distances = np.full(n, np.inf, dtype=xyz.dtype)
+    distances = np.empty(n, dtype=xyz.dtype)
+    offsets = np.empty(n, dtype=xyz.dtype)
+    index = start
+    for i in range(num_samples):
+        indices[i] = index
+        np.subtract(columns[0], columns[0, index], out=distances)
+        np.square(distances, out=distances)
+        for axis in (1, 2):
+            np.subtract(columns[axis], columns[axis, index], out=offsets)
+            np.square(offsets, out=offsets)
+            distances += offsets
+        np.minimum(min_distances, distances, out=min_distances)
+        index = np.argmax(min_distances)
+    return indices
+
+
+def sample_per_segment(seg, segment_ids, num_per_segment, rng=None):
+    """Return the indices of ``num_per_segment`` random points of each segment.
+
+    Segments with fewer points repeat them, so the output has a fixed shape.
+
+    Args:
+        seg: a (n,) array of segmentation ids.
+        segment_ids: the ids of the segments to sample, e.g., the links of an articulation.
+        num_per_segment: the number of points per segment.
+        rng: a numpy random generator.
+
+    Returns:
+        np.ndarray: a (len(segment_ids), num_per_segment) array of indices, -1 for absent segments.
+    """
+    rng = rng or np.random.default_rng()
+    segment_ids = np.asarray(segment_ids)
+    indices = np.full((len(segment_ids), num_per_segment), -1, dtype=np.int64)
+    if len(seg) == 0:
+        return indices
+    # Sort by segment, in random order within each segment
+    order = np.lexsort((rng.random(len(seg)), seg))
+    sorted_seg = seg[order]
+    starts = np.searchsorted(sorted_seg, segment_ids, side='left')
+    counts = np.searchsorted(sorted_seg, segment_ids, side='right') - starts
+    present = counts > 0
+    offsets = np.arange(num_per_segment) % counts[present, None]
+    indices[present] = order[starts[present, None] + offsets]
+    return indices
+
+
+def main():
+    import time
+    import sapien
+
+    scene = sapien.Scene()
+    loader = scene.create_urdf_loader()
+    loader.fix_root_link = True
+    loader.load("../assets/179/mobility.urdf")
+    scene.set_ambient_light([0.5, 0.5, 0.5])
+    scene.add_directional_light([0, 1, -1], [0.5, 0.5, 0.5])
+
+    camera = scene.add_camera(name="camera", width=640, height=480, fovy=np.deg2rad(35), near=0.1, far=100)
+    camera.entity.set_pose(sapien.Pose([-2, -2, 3], [0.8483, -0.1516, 0.3661, 0.3514]))
+    scene.update_render()
+    camera.take_picture()
+    num_iters = 100
+
+    # As in camera.py
+    start = time.perf_counter()
+    for _ in range(num_iters):
+        position = camera.get_picture("Position")
+        rgba = camera.get_picture("Color")
+        seg_labels = camera.get_picture("Segmentation")
+        valid = position[..., 3] < 1
+        model_matrix = camera.get_model_matrix()
+        points_world = position[..., :3][valid] @ model_matrix[:3, :3].T + model_matrix[:3, 3]
+        points_color = rgba[valid][:, :3]
+        points_seg = seg_labels[valid][:, 1]
+    print(f'NumPy: {(time.perf_counter() - start) / num_iters * 1000:.2f} ms, {len(points_world)} points')
+
+    extractor = PointCloudExtractor(camera)
+    xyz, rgb, seg = extractor.allocate()
+    start = time.perf_counter()
+    for _ in range(num_iters):
+        n = extractor.extract(xyz, rgb, seg)
+    print(f'PointCloudExtractor: {(time.perf_counter() - start) / num_iters * 1000:.2f} ms, {n} points')
+    assert np.allclose(xyz[:n], points_world, atol=1e-5) and np.array_equal(seg[:n], points_seg)
+
+    # A fixed number of points, e.g., for a point-cloud policy
+    start = time.perf_counter()
+    for _ in range(num_iters):
+        points, colors, labels = voxel_downsample(xyz[:n], 0.01, rgb[:n], seg[:n])
+        indices = farthest_point_sampling(points, 1024)
+    print(f'voxel_downsample + farthest_point_sampling: {(time.perf_counter() - start) / num_iters * 1000:.2f} ms, '
+          f'{len(points)} voxels, {len(indices)} points')
+
+
+if __name__ == "__main__":
+    main()
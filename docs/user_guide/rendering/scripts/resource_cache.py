@@ -0,0 +1,125 @@
+"""Shared resource cache.
+
+Concepts:
+    - Keep the textures and meshes loaded from files in a process-wide cache, keyed by
+      the path and the modification time of the file
+    - Hand out shared references, so objects using the same file share its memory
+    - Bound the memory of the cache, evicting the least recently used resources
+
+Usage:
+    cache = get_default_cache()
+    texture = cache.get('texture', filename)
+    if texture is None:
+        texture = sapien.render.RenderTexture2D(filename)
+        cache.put('texture', filename, texture, nbytes=texture.width * texture.height * 4)
+    print(cache.stats())
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 2 << 30
+
+
+class ResourceCache:
+    """An LRU cache of resources loaded from files.
+
+    A resource is identified by its kind (e.g., ``'texture'``), the absolute path
+    of its file and loading options, and is only returned while the file keeps the
+    modification time it had when the resource was put. When the resources exceed
+    ``max_bytes``, the least recently used ones are evicted. Evicted resources stay
+    valid for the objects using them; the cache only drops its reference.
+
+    Args:
+        max_bytes: the memory budget, in bytes, as reported by ``put``.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # (kind, path, options) -> (mtime_ns, resource, nbytes)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(kind, filename, options):
+        return kind, os.path.abspath(filename), tuple(options)
+
+    def get(self, kind, filename, options=()):
+        """Return the resource of a file, or None if it is not cached or the file has changed."""
+        key = self._key(kind, filename, options)
+        try:
+            mtime_ns = os.stat(key[1]).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != mtime_ns:
+                if entry is not None:
+                    del self._entries[key]  # the file has changed
+                    self.nbytes -= entry[2]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def contains(self, kind, filename, options=()):
+        """Whether the resource of a file is cached, without counting a hit or a miss."""
+        key = self._key(kind, filename, options)
+        try:
+            mtime_ns = os.stat(key[1]).st_mtime_ns
+        except OSError:
+            return False
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] == mtime_ns
+
+    def put(self, kind, filename, resource, nbytes, options=()):
+        """Add the resource of a file, replacing the one of an older version of the file."""
+        key = self._key(kind, filename, options)
+        mtime_ns = os.stat(key[1]).st_mtime_ns
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[2]
+            self._entries[key] = (mtime_ns, resource, nbytes)
+            self.nbytes += nbytes
+            # The newest resource is kept even if it exceeds the budget alone
+            while self.nbytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, _, size) = self._entries.popitem(last=False)
+                self.nbytes -= size
+                self.evictions += 1
+        return resource
+
+    def discard(self, kind, filename, options=()):
+        """Drop the resource of a file, if it is cached."""
+        with self._lock:
+            entry = self._entries.pop(self._key(kind, filename, options), None)
+            if entry is not None:
+                self.nbytes -= entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """Return the number of entries, their memory, and the hits, misses and evictions so far."""
+        with self._lock:
+            kinds = {}
+            for kind, _, _ in self._entries:
+                kinds[kind] = kinds.get(kind, 0) + 1
+            return dict(entries=len(self._entries), kinds=kinds, nbytes=self.nbytes, max_bytes=self.max_bytes,
+                        hits=self.hits, misses=self.misses, evictions=self.evictions)
+
+
+_default_cache = ResourceCache()
+
+
+def get_default_cache():
+    """Return the cache shared by the whole process."""
+    return _default_cache
@@ -2,44 +2,42 @@ import matplotlib.pyplot as plt
 import numpy as np
 import sapien.core as sapien
 import trimesh
+from asset_prefetch import AssetPrefetcher
 from sapien.core import Pose
-from sapien.render import RenderTexture2D
 from sapien.sensor import StereoDepthSensor, StereoDepthSensorConfig
 
 
-def build_scene(sim, renderer):
+def build_scene(sim, renderer, prefetcher):
     scene_config = sapien.SceneConfig()
     scene = sim.create_scene(scene_config)
+    objects = []  # (builder, pose)
 
     builder = scene.create_actor_builder()
     material = renderer.create_material()
     material.base_color = [1.0, 1.0, 1.0, 1.0]
-    material.set_diffuse_texture(RenderTexture2D("../assets/aligned/beer_can/texture.png"))
+    prefetcher.set_texture(material, "diffuse_texture", "../assets/aligned/beer_can/texture.png")
     material.metallic = 0.001
     material.roughness = 0.4
     builder.add_visual_from_file("../assets/aligned/beer_can/visual_mesh.obj", material=material)
-    beer_can = builder.build()
-    beer_can.set_pose(Pose([0.370301, -0.246856, 0.0738802], [0.922673, -0.00379302, -0.00852731, 0.385469]))
+    objects.append((builder, Pose([0.370301, -0.246856, 0.0738802], [0.922673, -0.00379302, -0.00852731, 0.385469])))
 
     builder = scene.create_actor_builder()
     material = renderer.create_material()
     material.base_color = [1.0, 1.0, 1.0, 1.0]
-    material.set_diffuse_texture(RenderTexture2D("../assets/aligned/champagne/texture.png"))
+    prefetcher.set_texture(material, "diffuse_texture", "../assets/aligned/champagne/texture.png")
     material.metallic = 0.01
     material.roughness = 0.2
     builder.add_visual_from_file("../assets/aligned/champagne/visual_mesh.obj", material=material)
-    champagne = builder.build()
-    champagne.set_pose(Pose([0.182963, -0.277838, 0.0873777], [0.723872, 0.00616071, -0.00678847, -0.689874]))
+    objects.append((builder, Pose([0.182963, -0.277838, 0.0873777], [0.723872, 0.00616071, -0.00678847, -0.689874])))
 
     builder = scene.create_actor_builder()
     material = renderer.create_material()
     material.base_color = [1.0, 1.0, 1.0, 1.0]
-    material.set_diffuse_texture(RenderTexture2D("../assets/aligned/pepsi_bottle/texture.png"))
+    prefetcher.set_texture(material, "diffuse_texture", "../assets/aligned/pepsi_bottle/texture.png")
     material.metallic = 0.001
     material.roughness = 0.6
     builder.add_visual_from_file("../assets/aligned/pepsi_bottle/visual_mesh.obj", material=material)
-    pepsi_bottle = builder.build()
-    pepsi_bottle.set_pose(Pose([0.392403, 0.0504232, 0.116739], [0.991259, -0.00145631, -0.00922613, 0.131601]))
+    objects.append((builder, Pose([0.392403, 0.0504232, 0.116739], [0.991259, -0.00145631, -0.00922613, 0.131601])))
 
     builder = scene.create_actor_builder()
     material = renderer.create_material()
@@ -47,23 +45,25 @@ def build_scene(sim, renderer):
     material.metallic = 0.8
     material.roughness = 0.2
     builder.add_visual_from_file("../assets/aligned/steel_ball/visual_mesh.obj", material=material)
-    steel_ball = builder.build()
-    steel_ball.set_pose(Pose([0.192034, 0.131187, 0.0170772], [0.949057, -0.0375225, 0.0676584, -0.305458]))
+    objects.append((builder, Pose([0.192034, 0.131187, 0.0170772], [0.949057, -0.0375225, 0.0676584, -0.305458])))
 
     builder = scene.create_actor_builder()
     builder.add_visual_from_file("../assets/aligned/water_bottle/water_bottle.glb")
-    water_bottle = builder.build()
-    water_bottle.set_pose(Pose([0.256327, -0.0162116, -0.01], [0.00627772, -0.0093401, 0.000145366, 1.0008]))
-    
+    objects.append((builder, Pose([0.256327, -0.0162116, -0.01], [0.00627772, -0.0093401, 0.000145366, 1.0008])))
+
     builder = scene.create_actor_builder()
     material = renderer.create_material()
     material.base_color = [1.0, 1.0, 1.0, 1.0]
-    material.set_diffuse_texture(RenderTexture2D("../assets/aligned/table/texture.png"))
+    prefetcher.set_texture(material, "diffuse_texture", "../assets/aligned/table/texture.png")
     material.metallic = 0.1
     material.roughness = 0.3
     builder.add_visual_from_file("../assets/aligned/table/visual_mesh.obj", material=material)
-    table = builder.build()
-    table.set_pose(Pose([0.405808, 0.022201, -0.043524], [0.999921, -0.000290915, -0.00932814, 0.00842011]))
+    objects.append((builder, Pose([0.405808, 0.022201, -0.043524], [0.999921, -0.000290915, -0.00932814, 0.00842011])))
+
+    # Meshes and textures are decoded in parallel, and building only attaches them
+    prefetcher.prefetch([builder for builder, _ in objects])
+    for builder, pose in objects:
+        builder.build().set_pose(pose)
 
     scene.set_ambient_light([0., 0., 0.])
     scene.add_point_light([1.0, 0.2, 2.5], [10, 10, 10])
@@ -84,7 +84,9 @@ def main():
     sapien.render.set_ray_tracing_path_depth(8)
     sapien.render.set_ray_tracing_denoiser("optix")
 
-    scene = build_scene(sim, renderer)
+    prefetcher = AssetPrefetcher()
+    scene = build_scene(sim, renderer, prefetcher)
+    prefetcher.close()
 
     sensor_mount_actor = scene.create_actor_builder().build_kinematic()
     sensor_config = StereoDepthSensorConfig()
@@ -0,0 +1,246 @@
+"""Entity index.
+
+Concepts:
+    - Look up entities by name, component type and user tags without scanning the scene
+    - Keep the index consistent with the lifecycle of entities in a scene
+"""
+
+from collections import defaultdict
+
+import sapien.core as sapien
+
+
+class EntityIndex:
+    """An index of the entities in a scene, keyed by name, component type and tags.
+
+    The index follows the component lifecycle (see ``advanced/lifecycle.md``):
+    every indexed entity gets a component whose ``on_add_to_scene`` and
+    ``on_remove_from_scene`` add the entity to the index and remove it, so
+    entities removed with ``scene.remove_entity`` leave the index. Entities added
+    to the scene without the index (e.g., built by builders or loaded from URDF)
+    are recorded by ``scene.add_entity``, which the index wraps, and indexed by
+    the next query, so names given right after building are indexed.
+
+    Names are indexed at the time an entity is indexed. Call ``remove`` and
+    ``add`` again after renaming an indexed entity or articulation.
+    """
+
+    def __init__(self, scene: sapien.Scene = None):
+        self._scene = scene
+        self._entities = {}  # global id -> entity
+        self._names = defaultdict(dict)  # name -> {global id: entity}
+        self._components = defaultdict(dict)  # component type -> {global id: component}
+        self._articulations = defaultdict(dict)  # name -> {global id of root: articulation}
+        self._tags = defaultdict(dict)  # tag -> {global id: entity}
+        self._records = {}  # global id -> (name, component types, articulation name, tags)
+        self._pending = []  # entities added to the scene since the last query
+        self._wrapped_scene = None  # the scene whose add_entity records entities for the index
+
+        if scene is not None:
+            self.rebuild(scene)
+
+    def rebuild(self, scene: sapien.Scene):
+        """Index all entities of a scene from scratch."""
+        if scene is not self._wrapped_scene:
+            self._wrap_add_entity(scene)
+        self._scene = scene
+        self.clear()
+        self.sync()
+
+    def sync(self):
+        """Index the entities of the scene that are not indexed yet."""
+        self._pending.clear()
+        for entity in self._scene.entities:
+            if entity.global_id not in self._entities and self._find_tracker(entity) is None:
+                self.add(entity)
+
+    def _wrap_add_entity(self, scene):
+        add_entity = scene.add_entity
+
+        def add_entity_and_record(entity):
+            add_entity(entity)
+            if self._scene is scene:
+                self._pending.append(entity)
+
+        scene.add_entity = add_entity_and_record
+        self._wrapped_scene = scene
+
+    def _index_pending(self):
+        pending, self._pending = self._pending, []
+        for entity in pending:
+            # Skip entities indexed explicitly, removed from the index or from the scene
+            if entity.scene is not None and self._find_tracker(entity) is None:
+                self.add(entity)
+
+    def clear(self):
+        self._pending.clear()
+        self._entities.clear()
+        self._names.clear()
+        self._components.clear()
+        self._articulations.clear()
+        self._tags.clear()
+        self._records.clear()
+
+    # ---------------------------------------------------------------------------- #
+    # Lifecycle
+    # ---------------------------------------------------------------------------- #
+    def _find_tracker(self, entity):
+        for component in entity.components:
+            if isinstance(component, _IndexTracker) and component.index is self:
+                return component
+        return None
+
+    def add(self, entity: sapien.Entity, tags=()):
+        """Index an entity while it is in a scene. It may be added to the scene before or after."""
+        tracker = self._find_tracker(entity)
+        if tracker is None:
+            tracker = _IndexTracker(self)
+            tracker.tags.update(tags)
+            entity.add_component(tracker)  # indexes the entity if it is in a scene
+        elif entity.global_id in self._entities:
+            raise RuntimeError(f'Entity already indexed: {entity.name}')
+        else:
+            tracker.enabled = True
+            tracker.tags.update(tags)
+        if entity.scene is not None and entity.global_id not in self._entities:
+            self._add(entity, tracker.tags)
+
+    def remove(self, entity: sapien.Entity):
+        """Stop indexing an entity."""
+        tracker = self._find_tracker(entity)
+        if tracker is None or not tracker.enabled:
+            raise RuntimeError(f'Entity not indexed: {entity.name}')
+        # The tracker stays, so that queries do not index the entity again
+        tracker.enabled = False
+        if entity.global_id in self._entities:
+            self._remove(entity)
+
+    def _add(self, entity, tags):
+        gid = entity.global_id
+        self._entities[gid] = entity
+        self._names[entity.name][gid] = entity
+
+        component_types = []
+        articulation_name = None
+        for component in entity.components:
+            if isinstance(component, _IndexTracker):
+                continue
+            for cls in type(component).__mro__:
+                if not issubclass(cls, sapien.Component):
+                    continue
+                # Keep the first component of each type, like find_component_by_type
+                if gid not in self._components[cls]:
+                    self._components[cls][gid] = component
+                    component_types.append(cls)
+            if isinstance(component, sapien.physx.PhysxArticulationLinkComponent) and component.is_root:
+                articulation_name = component.articulation.name
+                self._articulations[articulation_name][gid] = component.articulation
+
+        self._records[gid] = (entity.name, component_types, articulation_name, tags)
+        for tag in tags:
+            self._tags[tag][gid] = entity
+
+    def _remove(self, entity):
+        gid = entity.global_id
+        name, component_types, articulation_name, tags = self._records.pop(gid)
+        del self._entities[gid]
+        self._discard(self._names, name, gid)
+        for cls in component_types:
+            self._discard(self._components, cls, gid)
+        if articulation_name is not None:
+            self._discard(self._articulations, articulation_name, gid)
+        for tag in tags:
+            self._discard(self._tags, tag, gid)
+
+    @staticmethod
+    def _discard(table, key, gid):
+        entries = table[key]
+        entries.pop(gid, None)
+        if not entries:
+            del table[key]
+
+    # ---------------------------------------------------------------------------- #
+    # Tags
+    # ---------------------------------------------------------------------------- #
+    def tag(self, entity: sapien.Entity, *tags):
+        self._index_pending()
+        gid = entity.global_id
+        entity_tags = self._records[gid][3]
+        for tag in tags:
+            entity_tags.add(tag)
+            self._tags[tag][gid] = entity
+
+    def untag(self, entity: sapien.Entity, *tags):
+        self._index_pending()
+        gid = entity.global_id
+        entity_tags = self._records[gid][3]
+        for tag in tags:
+            if tag in entity_tags:
+                entity_tags.remove(tag)
+                self._discard(self._tags, tag, gid)
+
+    # ---------------------------------------------------------------------------- #
+    # Queries
+    # ---------------------------------------------------------------------------- #
+    def get_entities(self, name=None):
+        self._index_pending()
+        if name is None:
+            return list(self._entities.values())
+        return list(self._names.get(name, {}).values())
+
+    def get_entities_by_tag(self, tag):
+        self._index_pending()
+        return list(self._tags.get(tag, {}).values())
+
+    def get_components(self, cls):
+        """All (indexed) components of the given type, including subclasses."""
+        self._index_pending()
+        return list(self._components.get(cls, {}).values())
+
+    def find_component_by_type(self, entity: sapien.Entity, cls):
+        """Same as ``entity.find_component_by_type(cls)``, but without scanning the components."""
+        self._index_pending()
+        return self._components.get(cls, {}).get(entity.global_id)
+
+    def get_actors(self, name):
+        """Entities named ``name`` with a rigid body or a render body that are not articulation links.
+
+        These are the actors of ``scene.get_all_actors``, and actors with only visual shapes.
+        """
+        self._index_pending()
+        links = self._components.get(sapien.physx.PhysxArticulationLinkComponent, {})
+        dynamic = self._components.get(sapien.physx.PhysxRigidDynamicComponent, {})
+        static = self._components.get(sapien.physx.PhysxRigidStaticComponent, {})
+        render = self._components.get(sapien.render.RenderBodyComponent, {})
+        return [entity for gid, entity in self._names.get(name, {}).items()
+                if gid not in links and (gid in dynamic or gid in static or gid in render)]
+
+    def get_articulations(self, name):
+        self._index_pending()
+        return list(self._articulations.get(name, {}).values())
+
+    def __len__(self):
+        self._index_pending()
+        return len(self._entities)
+
+    def __contains__(self, entity: sapien.Entity):
+        self._index_pending()
+        return entity.global_id in self._entities
+
+
+class _IndexTracker(sapien.Component):
+    """Adds its entity to an index when the entity is added to a scene, and removes it when it is removed."""
+
+    def __init__(self, index):
+        super().__init__()
+        self.index = index
+        self.tags = set()
+        self.enabled = True  # False once removed from the index
+
+    def on_add_to_scene(self, scene):
+        if self.enabled and self.entity.global_id not in self.index._entities:
+            self.index._add(self.entity, self.tags)
+
+    def on_remove_from_scene(self, scene):
+        if self.entity.global_id in self.index._entities:
+            self.index._remove(self.entity)
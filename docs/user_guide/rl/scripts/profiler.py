@@ -0,0 +1,225 @@
+"""Step profiler.
+
+Concepts:
+    - Time the phases of SapienEnv.step separately: actions, physics substeps,
+      update_render, observation and reward
+    - Separate the time of Python glue code (self time) from nested phases
+    - Export a Chrome trace (chrome://tracing or https://ui.perfetto.dev)
+
+Usage:
+    python profiler.py --env lift --num-steps 1000 --trace lift_trace.json
+"""
+
+import json
+import os
+import time
+
+
+class StepProfiler:
+    """Aggregate the time spent in nested phases.
+
+    For every phase, the profiler counts the calls, the total time, the maximum
+    time and the self time, i.e., the time not spent in nested phases. With
+    ``trace=True``, every phase is also recorded as an event of a Chrome trace.
+
+    Notes:
+        Phases are tracked with a single stack, so profile one thread only.
+    """
+
+    def __init__(self, trace=False, max_trace_events=1000000):
+        self.trace = trace
+        self.max_trace_events = max_trace_events
+        self.stats = {}  # name -> [count, total_ns, self_ns, max_ns]
+        self.num_dropped_events = 0
+        self._events = []  # (name, start_ns, duration_ns)
+        self._stack = []  # [name, start_ns, child_ns]
+        self._patches = []
+        self._origin = time.perf_counter_ns()
+
+    # ---------------------------------------------------------------------------- #
+    # Recording
+    # ---------------------------------------------------------------------------- #
+    def begin(self, name):
+        self._stack.append([name, time.perf_counter_ns(), 0])
+
+    def end(self):
+        end = time.perf_counter_ns()
+        name, start, child_ns = self._stack.pop()
+        self._add(name, start, end - start, child_ns)
+
+    def record(self, name, start, end):
+        """Record a phase timed by the caller as a child of the current phase."""
+        self._add(name, start, end - start, 0)
+
+    def _add(self, name, start, duration, child_ns):
+        if self._stack:
+            self._stack[-1][2] += duration
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = [0, 0, 0, 0]
+        stats[0] += 1
+        stats[1] += duration
+        stats[2] += duration - child_ns
+        if duration > stats[3]:
+            stats[3] = duration
+        if self.trace:
+            if len(self._events) < self.max_trace_events:
+                self._events.append((name, start, duration))
+            else:
+                self.num_dropped_events += 1
+
+    def phase(self, name):
+        """Return a context manager timing a phase."""
+        return _Phase(self, name)
+
+    def wrap(self, fn, name):
+        """Return a function calling ``fn`` inside a phase."""
+        begin, end = self.begin, self.end
+
+        def wrapper(*args, **kwargs):
+            begin(name)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                end()
+
+        return wrapper
+
+    def reset(self):
+        self.stats.clear()
+        self._events.clear()
+        self.num_dropped_events = 0
+
+    # ---------------------------------------------------------------------------- #
+    # Instrumentation
+    # ---------------------------------------------------------------------------- #
+    def patch(self, obj, name, wrapper):
+        """Replace the method ``name`` of the instance ``obj`` until ``unpatch``."""
+        setattr(obj, name, wrapper)
+        self._patches.append((obj, name))
+
+    def unpatch(self):
+        for obj, name in reversed(self._patches):
+            delattr(obj, name)  # the method of the class is visible again
+        self._patches.clear()
+
+    # ---------------------------------------------------------------------------- #
+    # Reports
+    # ---------------------------------------------------------------------------- #
+    def summary(self):
+        """Return one row per phase, sorted by total time."""
+        rows = []
+        for name, (count, total_ns, self_ns, max_ns) in self.stats.items():
+            rows.append(dict(phase=name, count=count, total_ms=total_ns / 1e6, self_ms=self_ns / 1e6,
+                             mean_us=total_ns / count / 1e3, max_us=max_ns / 1e3))
+        return sorted(rows, key=lambda row: -row['total_ms'])
+
+    def print_summary(self):
+        print(f'{"phase":<16}{"count":>10}{"total ms":>12}{"self ms":>12}{"mean us":>12}{"max us":>12}')
+        for row in self.summary():
+            print(f'{row["phase"]:<16}{row["count"]:>10}{row["total_ms"]:>12.1f}{row["self_ms"]:>12.1f}'
+                  f'{row["mean_us"]:>12.1f}{row["max_us"]:>12.1f}')
+
+    def export_chrome_trace(self, path):
+        """Write the recorded events in the Chrome trace event format."""
+        pid = os.getpid()
+        events = [dict(name=name, ph='X', ts=(start - self._origin) / 1e3, dur=duration / 1e3, pid=pid, tid=0)
+                  for name, start, duration in self._events]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+class _Phase:
+    __slots__ = ('profiler', 'name')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.begin(self.name)
+
+    def __exit__(self, *args):
+        self.profiler.end()
+
+
+def instrument_env(env, profiler: StepProfiler):
+    """Time the phases of a SapienEnv until ``profiler.unpatch()`` is called.
+
+    The phases are ``step``, ``reset``, ``physics`` (every ``scene.step()``),
+    ``update_render``, ``observation`` (``_get_obs``) and ``reward`` (``_get_reward``,
+    if the environment has one). ``action`` is the time from the beginning of
+    ``step`` to its first substep, where actions are applied (e.g., ``set_qf`` and
+    drive targets). The self time of ``step`` is the remaining Python code.
+
+    Instrument an environment before passing it to a wrapper (e.g., ``VecSapienEnv``),
+    since wrappers may look its methods up only once.
+    """
+    scene = env._scene
+    clock = time.perf_counter_ns
+    begin, end = profiler.begin, profiler.end
+    env_step, scene_step = env.step, scene.step
+    step_start = None  # set until the first substep of a step
+
+    def step(action):
+        nonlocal step_start
+        begin('step')
+        step_start = clock()
+        try:
+            return env_step(action)
+        finally:
+            step_start = None
+            end()
+
+    def physics_step():
+        nonlocal step_start
+        if step_start is not None:
+            profiler.record('action', step_start, clock())
+            step_start = None
+        begin('physics')
+        try:
+            scene_step()
+        finally:
+            end()
+
+    profiler.patch(env, 'step', step)
+    profiler.patch(scene, 'step', physics_step)
+    profiler.patch(env, 'reset', profiler.wrap(env.reset, 'reset'))
+    profiler.patch(scene, 'update_render', profiler.wrap(scene.update_render, 'update_render'))
+    profiler.patch(env, '_get_obs', profiler.wrap(env._get_obs, 'observation'))
+    if hasattr(env, '_get_reward'):
+        profiler.patch(env, '_get_reward', profiler.wrap(env._get_reward, 'reward'))
+    return env
+
+
+def main():
+    import argparse
+    from ant import AntEnv
+    from lift import LiftEnv
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--env', choices=['ant', 'lift'], default='lift')
+    parser.add_argument('--num-steps', type=int, default=1000)
+    parser.add_argument('--trace', type=str, default=None, help='path of a Chrome trace')
+    args = parser.parse_args()
+
+    env = {'ant': AntEnv, 'lift': LiftEnv}[args.env]()
+    profiler = StepProfiler(trace=args.trace is not None)
+    instrument_env(env, profiler)
+
+    env.reset()
+    for _ in range(args.num_steps):
+        obs, reward, done, info = env.step(env.action_space.sample())
+        if done:
+            env.reset()
+
+    profiler.print_summary()
+    if args.trace:
+        profiler.export_chrome_trace(args.trace)
+        print(f'Chrome trace: {args.trace}')
+    profiler.unpatch()
+    env.close()
+
+
+if __name__ == '__main__':
+    main()
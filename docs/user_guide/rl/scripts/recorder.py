@@ -0,0 +1,360 @@
+"""Trajectory recorder.
+
+Concepts:
+    - Stream observations, actions, rewards, done flags and packed states to disk
+    - Store each field in chunked, memory-mappable .npy files (columnar layout)
+    - Write from a background thread through a bounded queue
+    - Keep an append-only index of chunks and episodes
+
+Layout of a recording:
+    root/
+        index.jsonl                 # one JSON object per line, append-only
+        chunk_000000/obs.npy        # [chunk_size, obs_dim]
+        chunk_000000/action.npy     # [chunk_size, action_dim]
+        chunk_000000/reward.npy     # [chunk_size]
+        chunk_000000/done.npy       # [chunk_size]
+        chunk_000000/state.npy      # [chunk_size, state_size] (optional)
+        episode_000000.state        # packed initial state of an episode (optional)
+"""
+
+import json
+import os
+import queue
+import threading
+import warnings
+
+import numpy as np
+
+
+class TrajectoryRecorder:
+    """Record transitions into chunked columnar files from a background thread.
+
+    Transitions are copied into a preallocated chunk buffer on the calling thread.
+    Full chunks are handed to the writer thread, which returns the buffers once
+    they are written. At most ``max_pending_chunks`` chunks wait to be written,
+    so the memory usage is bounded.
+
+    Args:
+        root: the directory of the recording. It must not contain a recording yet.
+        chunk_size: the number of steps per chunk.
+        max_pending_chunks: the number of chunks waiting to be written.
+        on_full: what to do when all chunk buffers are waiting to be written.
+            ``'drop'`` never stalls stepping: steps are discarded until a buffer is
+            free, and the affected episodes are marked as incomplete in the index.
+            A warning is issued when the first step is dropped.
+            ``'block'`` waits for the writer thread instead.
+
+    The fields of a recording are fixed by the first ``record`` call: ``state``
+    must be given at every step or never.
+    """
+
+    def __init__(self, root, chunk_size=4096, max_pending_chunks=4, on_full='drop'):
+        assert on_full in ('block', 'drop'), 'Unsupported on_full: {}'.format(on_full)
+        os.makedirs(root, exist_ok=False)
+        self.root = root
+        self.chunk_size = chunk_size
+        self.on_full = on_full
+
+        self._queue = queue.Queue()
+        self._free_buffers = queue.Queue()
+        self._num_buffers = max_pending_chunks + 1
+        self._buffer = None  # the chunk buffer being filled
+        self._fill = 0  # number of steps in the current buffer
+        self._dtypes = None
+
+        self.num_steps = 0  # recorded steps
+        self.num_dropped_steps = 0
+        self._num_chunks = 0
+        self._num_episodes = 0
+        self._episode_start = None
+        self._episode_complete = True
+        self._error = None  # the first error of the writer thread
+
+        self._index_file = open(os.path.join(root, 'index.jsonl'), 'a')
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    # ---------------------------------------------------------------------------- #
+    # Recording (calling thread)
+    # ---------------------------------------------------------------------------- #
+    def _allocate(self, fields):
+        self._dtypes = {}
+        for name, value in fields.items():
+            value = np.asarray(value)
+            self._dtypes[name] = (value.dtype, value.shape)
+        for _ in range(self._num_buffers):
+            self._free_buffers.put({name: np.empty((self.chunk_size,) + shape, dtype=dtype)
+                                    for name, (dtype, shape) in self._dtypes.items()})
+
+    def _acquire_buffer(self):
+        if self.on_full == 'block':
+            buffer = self._free_buffers.get()
+        else:
+            try:
+                buffer = self._free_buffers.get_nowait()
+            except queue.Empty:
+                return None
+        if buffer is None:  # put by the writer thread when it fails
+            self._free_buffers.put(None)
+            self._raise_error()
+        return buffer
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise RuntimeError('The recording could not be written.') from self._error
+
+    def start_episode(self, initial_state=None):
+        """Start a new episode. ``initial_state`` is the packed state at reset."""
+        if self._episode_start is not None:
+            self._end_episode()
+        self._episode_start = self.num_steps
+        self._episode_complete = True
+        if initial_state is not None:
+            self._queue.put(('state', self._num_episodes, bytes(initial_state)))
+
+    def record(self, obs, action, reward, done, state=None):
+        """Record one transition: the action taken at ``obs`` and its outcome.
+
+        ``state`` is the packed state after the step (e.g., ``physx_system.pack()``).
+        """
+        self._raise_error()
+        fields = dict(obs=obs, action=action, reward=reward, done=done)
+        if state is not None:
+            fields['state'] = np.frombuffer(state, dtype=np.uint8)
+        if self._dtypes is None:
+            self._allocate(fields)
+        elif fields.keys() != self._dtypes.keys():
+            raise RuntimeError('The fields of a recording cannot change: got {}, expected {}.'.format(
+                sorted(fields), sorted(self._dtypes)))
+        if self._episode_start is None:
+            self.start_episode()
+
+        if self._buffer is None:
+            self._buffer = self._acquire_buffer()
+            if self._buffer is None:
+                if self.num_dropped_steps == 0:
+                    warnings.warn('The writer cannot keep up, steps are dropped. '
+                                  "Use a larger max_pending_chunks, or on_full='block'.")
+                self.num_dropped_steps += 1
+                self._episode_complete = False
+                if done:
+                    self._end_episode()
+                return
+
+        for name, value in fields.items():
+            self._buffer[name][self._fill] = value
+        self._fill += 1
+        self.num_steps += 1
+        if self._fill == self.chunk_size:
+            self._flush_chunk()
+        if done:
+            self._end_episode()
+
+    def _flush_chunk(self):
+        if self._buffer is None or self._fill == 0:
+            return
+        start = self.num_steps - self._fill
+        self._queue.put(('chunk', self._num_chunks, start, self._fill, self._buffer))
+        self._num_chunks += 1
+        self._buffer = None
+        self._fill = 0
+
+    def _end_episode(self):
+        entry = dict(type='episode', id=self._num_episodes, start=self._episode_start,
+                     length=self.num_steps - self._episode_start, complete=self._episode_complete)
+        self._queue.put(('index', entry))
+        self._num_episodes += 1
+        self._episode_start = None
+
+    def close(self):
+        """Flush the remaining steps and wait for the writer thread."""
+        if self._thread is None:
+            return
+        if self._episode_start is not None and self.num_steps > self._episode_start:
+            self._end_episode()
+        self._flush_chunk()
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._index_file.close()
+        self._raise_error()
+
+    # ---------------------------------------------------------------------------- #
+    # Writing (background thread)
+    # ---------------------------------------------------------------------------- #
+    def _append_index(self, entry):
+        self._index_file.write(json.dumps(entry) + '\n')
+        self._index_file.flush()
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            kind = item[0]
+            if self._error is not None:
+                # Nothing is written after an error, but buffers are still returned
+                if kind == 'chunk':
+                    self._free_buffers.put(item[-1])
+                continue
+            try:
+                if kind == 'chunk':
+                    self._write_chunk(*item[1:])
+                elif kind == 'state':
+                    _, episode_id, state = item
+                    with open(os.path.join(self.root, 'episode_{:06d}.state'.format(episode_id)), 'wb') as f:
+                        f.write(state)
+                elif kind == 'index':
+                    self._append_index(item[1])
+            except Exception as e:
+                self._error = e
+                self._free_buffers.put(None)  # wakes up record, which raises the error
+            finally:
+                if kind == 'chunk':
+                    self._free_buffers.put(item[-1])
+
+    def _write_chunk(self, chunk_id, start, length, buffer):
+        name = 'chunk_{:06d}'.format(chunk_id)
+        tmp_dir = os.path.join(self.root, name + '.tmp')
+        os.makedirs(tmp_dir)
+        for field, data in buffer.items():
+            array = np.lib.format.open_memmap(
+                os.path.join(tmp_dir, field + '.npy'), mode='w+', dtype=data.dtype,
+                shape=(length,) + data.shape[1:])
+            array[:] = data[:length]
+            array.flush()
+            del array
+        # A chunk becomes visible only after all its files are complete
+        os.rename(tmp_dir, os.path.join(self.root, name))
+        self._append_index(dict(type='chunk', id=chunk_id, start=start, length=length, dir=name))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TrajectoryReader:
+    """Read a recording written by ``TrajectoryRecorder``.
+
+    Only chunks and episodes listed in the index are visible, so a recording that
+    is still being written (or was interrupted) can be read safely.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.chunks = []
+        self.episodes = []
+        with open(os.path.join(root, 'index.jsonl')) as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    break  # partially written entry
+                entry = json.loads(line)
+                if entry['type'] == 'chunk':
+                    self.chunks.append(entry)
+                elif entry['type'] == 'episode':
+                    self.episodes.append(entry)
+        self.chunks.sort(key=lambda c: c['start'])
+        self.num_steps = sum(c['length'] for c in self.chunks)
+        self.fields = sorted(os.path.splitext(f)[0] for f in os.listdir(
+            os.path.join(root, self.chunks[0]['dir']))) if self.chunks else []
+        # Episodes may end in a chunk that has not been written yet
+        self.episodes = [e for e in self.episodes if e['start'] + e['length'] <= self.num_steps]
+
+    def _load_field(self, chunk, field):
+        return np.load(os.path.join(self.root, chunk['dir'], field + '.npy'), mmap_mode='r')
+
+    def get_steps(self, field, start, stop):
+        """Return ``field`` of the recorded steps in ``[start, stop)``."""
+        parts = []
+        for chunk in self.chunks:
+            lo, hi = max(start, chunk['start']), min(stop, chunk['start'] + chunk['length'])
+            if lo < hi:
+                parts.append(self._load_field(chunk, field)[lo - chunk['start']:hi - chunk['start']])
+        if not parts:
+            # An empty range, with the shape and dtype of the field
+            return self._load_field(self.chunks[0], field)[:0] if self.chunks else np.zeros(0)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def get_episode(self, episode_id, fields=('obs', 'action', 'reward', 'done')):
+        episode = self.episodes[episode_id]
+        start, stop = episode['start'], episode['start'] + episode['length']
+        return {field: self.get_steps(field, start, stop) for field in fields}
+
+    def get_initial_state(self, episode_id):
+        path = os.path.join(self.root, 'episode_{:06d}.state'.format(self.episodes[episode_id]['id']))
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+
+class RecordingEnv:
+    """Wrap a SapienEnv so that every transition is recorded.
+
+    Other attributes are forwarded to the wrapped environment.
+    """
+
+    def __init__(self, env, recorder: TrajectoryRecorder, record_state=False):
+        self.env = env
+        self.recorder = recorder
+        self.record_state = record_state
+        self._pack = env._scene.physx_system.pack
+        self._unpack = env._scene.physx_system.unpack
+        self._obs = None
+
+    def reset(self):
+        obs = self.env.reset()
+        initial_state = None
+        if self.record_state:
+            # Continue from the unpacked state, as a replay does, so both start from the same bytes
+            initial_state = self._pack()
+            self._unpack(initial_state)
+        self.recorder.start_episode(initial_state)
+        self._obs = np.array(obs, dtype=np.float32)
+        return obs
+
+    def step(self, action):
+        obs, reward, done, info = self.env.step(action)
+        state = self._pack() if self.record_state else None
+        self.recorder.record(self._obs, action, reward, done, state)
+        self._obs = np.array(obs, dtype=np.float32)
+        return obs, reward, done, info
+
+    def __getattr__(self, name):
+        return getattr(self.env, name)
+
+
+def main():
+    import argparse
+    from ant import AntEnv
+    from lift import LiftEnv
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--env', choices=['ant', 'lift'], default='ant')
+    parser.add_argument('--num-steps', type=int, default=100000)
+    parser.add_argument('--record-state', action='store_true')
+    parser.add_argument('--output', type=str, default='recording')
+    args = parser.parse_args()
+
+    env_fn = {'ant': AntEnv, 'lift': LiftEnv}[args.env]
+    with TrajectoryRecorder(args.output) as recorder:
+        env = RecordingEnv(env_fn(), recorder, record_state=args.record_state)
+        env.reset()
+        for _ in range(args.num_steps):
+            obs, reward, done, info = env.step(env.action_space.sample())
+            if done:
+                env.reset()
+        env.close()
+
+    reader = TrajectoryReader(args.output)
+    print(f'Recorded {reader.num_steps} steps in {len(reader.chunks)} chunks '
+          f'and {len(reader.episodes)} episodes')
+    if reader.episodes:
+        episode = reader.get_episode(0)
+        print('First episode:', {k: v.shape for k, v in episode.items()})
+
+
+if __name__ == '__main__':
+    main()
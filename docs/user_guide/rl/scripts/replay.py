@@ -0,0 +1,172 @@
+"""Trajectory replay.
+
+Concepts:
+    - Re-simulate a recorded episode from its initial state and actions
+    - Store packed checkpoints every K steps to seek to any step quickly
+    - Find the first step where the replay diverges from the recording
+
+Usage:
+    python recorder.py --env ant --record-state --output recording
+    python replay.py --env ant --recording recording --episode 0 --seek 500
+"""
+
+import numpy as np
+
+from snapshot import SnapshotStore
+
+
+class ReplayEngine:
+    """Replay a sequence of actions from a packed initial state.
+
+    Checkpoints are stored every ``checkpoint_every`` steps as the replay moves
+    forward, so seeking to a step costs at most ``checkpoint_every`` steps once
+    the replay has passed it. Checkpoints are kept in a ``SnapshotStore``.
+
+    Args:
+        env: a SapienEnv. Its ``step`` must set all the actuation (e.g., ``set_qf``
+            and drive targets) at every step, as ``AntEnv`` and ``LiftEnv`` do,
+            since drive targets and forces are not part of a packed state.
+        actions: [num_steps, action_dim] actions.
+        initial_state: the packed state before the first action.
+        states: [num_steps, state_size] uint8 packed states after each action (optional).
+        checkpoint_every: the number of steps between two checkpoints.
+        max_bytes: the memory budget of checkpoints.
+    """
+
+    def __init__(self, env, actions, initial_state, states=None, checkpoint_every=1000,
+                 max_bytes=1024 ** 3):
+        self.env = env
+        self.actions = actions
+        self.states = states
+        self.checkpoint_every = checkpoint_every
+        self._physx_system = env._scene.physx_system
+        self._step = env.step
+        self._initial_state = initial_state
+        self.checkpoints = SnapshotStore(self._physx_system, base_state=initial_state, max_bytes=max_bytes)
+        self.t = 0
+        self._physx_system.unpack(initial_state)
+
+    @classmethod
+    def from_recording(cls, env, reader, episode_id, **kwargs):
+        """Create a replay of an episode of a ``TrajectoryReader``."""
+        initial_state = reader.get_initial_state(episode_id)
+        if initial_state is None:
+            raise RuntimeError('The episode has no initial state. Record it with record_state=True.')
+        fields = ('action', 'state') if 'state' in reader.fields else ('action',)
+        episode = reader.get_episode(episode_id, fields=fields)
+        return cls(env, episode['action'], initial_state, states=episode.get('state'), **kwargs)
+
+    def __len__(self):
+        return len(self.actions)
+
+    # ---------------------------------------------------------------------------- #
+    # Replay
+    # ---------------------------------------------------------------------------- #
+    def step(self):
+        """Apply the action of the current step and return the output of ``env.step``."""
+        ret = self._step(self.actions[self.t])
+        self.t += 1
+        if self.t % self.checkpoint_every == 0 and self.t not in self.checkpoints:
+            self.checkpoints.save(self.t)
+        return ret
+
+    def run(self, stop=None):
+        """Replay until step ``stop`` (defaults to the end of the episode)."""
+        stop = len(self) if stop is None else stop
+        while self.t < stop:
+            self.step()
+
+    def seek(self, t):
+        """Restore the state before the action of step ``t``.
+
+        The replay restarts from the latest checkpoint at or before ``t``.
+        """
+        if not 0 <= t <= len(self):
+            raise IndexError('Step {} is out of range [0, {}].'.format(t, len(self)))
+        if not self.t <= t < self.t + self.checkpoint_every:
+            # Checkpoints may have been evicted
+            keys = [k for k in self.checkpoints.keys() if k <= t]
+            if keys:
+                self.t = max(keys)
+                self.checkpoints.restore(self.t)
+            else:
+                self.t = 0
+                self._physx_system.unpack(self._initial_state)
+        self.run(t)
+
+    def find_divergence(self, start=0, atol=1e-3, rtol=1e-3):
+        """Return the first step whose packed state differs from the recorded one.
+
+        States are compared as float32 arrays, within ``atol + rtol * |recorded|``:
+        a replay in another process is not bit-identical to the recording. The
+        replay starts from ``start`` (restored by ``seek``).
+
+        Returns:
+            tuple: ``(step, index, difference)``, where ``index`` is the offset of the
+            largest difference in the float32 state, or None if the whole episode matches.
+        """
+        if self.states is None:
+            raise RuntimeError('The recording has no states. Record it with record_state=True.')
+        self.seek(start)
+        pack = self._physx_system.pack
+        while self.t < len(self):
+            t = self.t
+            self.step()
+            replayed = np.frombuffer(pack(), dtype=np.float32)
+            recorded = self.states[t].view(np.float32)
+            difference = np.abs(replayed - recorded)
+            if not np.all(difference <= atol + rtol * np.abs(recorded)):
+                index = int(np.nanargmax(np.where(np.isnan(difference), np.inf, difference)))
+                return t, index, float(difference[index])
+        return None
+
+
+def describe_divergence(divergence):
+    if divergence is None:
+        return 'no divergence'
+    return 'diverges at step {} (float {} differs by {:.3g})'.format(*divergence)
+
+
+def main():
+    import argparse
+    import time
+    from ant import AntEnv
+    from lift import LiftEnv
+    from recorder import TrajectoryReader
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--env', choices=['ant', 'lift'], default='ant')
+    parser.add_argument('--recording', type=str, default='recording')
+    parser.add_argument('--episode', type=int, default=0)
+    parser.add_argument('--checkpoint-every', type=int, default=1000)
+    parser.add_argument('--seek', type=int, default=None)
+    args = parser.parse_args()
+
+    env = {'ant': AntEnv, 'lift': LiftEnv}[args.env]()
+    reader = TrajectoryReader(args.recording)
+    replay = ReplayEngine.from_recording(env, reader, args.episode, checkpoint_every=args.checkpoint_every)
+
+    start = time.perf_counter()
+    replay.run()
+    elapsed = time.perf_counter() - start
+    print(f'Replayed {len(replay)} steps in {elapsed:.3f}s ({len(replay) / elapsed:.0f} steps/s)')
+
+    if args.seek is not None:
+        start = time.perf_counter()
+        replay.seek(args.seek)
+        print(f'Seeked to step {args.seek} in {(time.perf_counter() - start) * 1000:.1f}ms')
+
+    if replay.states is not None:
+        print('Replay:', describe_divergence(replay.find_divergence()))
+
+        # Perturb one action, e.g., to check that a divergence is detected
+        t = len(replay) // 2
+        replay.actions = np.array(replay.actions)
+        replay.actions[t] += 0.5
+        replay.checkpoints.clear()  # checkpoints after t are no longer valid
+        print('After perturbing the action of step {}:'.format(t), describe_divergence(replay.find_divergence()))
+    env.close()
+
+
+if __name__ == '__main__':
+    main()
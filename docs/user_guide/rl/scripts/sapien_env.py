@@ -1,7 +1,11 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
 import sapien.core as sapien
 
 import gymnasium as gym
 from gymnasium.utils import seeding
+from entity_index import EntityIndex
 
 
 class SapienEnv(gym.Env):
@@ -14,10 +18,14 @@ class SapienEnv(gym.Env):
         self._scene = sapien.Scene()
         self._scene.set_timestep(timestep)
 
+        self._entity_index = None  # built lazily on the first lookup
         self._build_world()
         self.viewer = None
         self.seed()
 
+        self._executor = None  # worker thread for step_async
+        self._step_future = None
+
     def _build_world(self):
         raise NotImplementedError()
 
@@ -34,6 +42,9 @@ class SapienEnv(gym.Env):
     def close(self):
         if self.viewer is not None:
             pass  # release viewer
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
 
     def render(self, mode='human'):
         if mode == 'human':
@@ -45,12 +56,46 @@ class SapienEnv(gym.Env):
         else:
             raise NotImplementedError('Unsupported render mode {}.'.format(mode))
 
+    # ---------------------------------------------------------------------------- #
+    # Asynchronous stepping
+    # ---------------------------------------------------------------------------- #
+    def step_async(self, action):
+        """Start ``step(action)`` on a worker thread and return immediately."""
+        if self._step_future is not None:
+            raise RuntimeError('step_async is called again before step_result')
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        self._step_future = self._executor.submit(self.step, action)
+
+    async def step_result(self):
+        """Wait for the step started by ``step_async`` and return its result.
+
+        Unlike the blocking ``step_wait`` of vectorized environments, it is a
+        coroutine and must be awaited.
+        """
+        if self._step_future is None:
+            raise RuntimeError('step_result is called without step_async')
+        future, self._step_future = self._step_future, None
+        return await asyncio.wrap_future(future)
+
     # ---------------------------------------------------------------------------- #
     # Utilities
     # ---------------------------------------------------------------------------- #
+    @property
+    def entity_index(self):
+        if self._entity_index is None:
+            self._entity_index = EntityIndex(self._scene)
+        return self._entity_index
+
+    def add_entity(self, entity, tags=()):
+        self._scene.add_entity(entity)
+        self.entity_index.add(entity, tags)
+
+    def remove_entity(self, entity):
+        self._scene.remove_entity(entity)  # the index follows the scene
+
     def get_actor(self, name):
-        all_actors = self._scene.get_all_actors()
-        actor = [x for x in all_actors if x.name == name]
+        actor = self.entity_index.get_actors(name)
         if len(actor) > 1:
             raise RuntimeError(f'Not a unique name for actor: {name}')
         elif len(actor) == 0:
@@ -58,8 +103,7 @@ class SapienEnv(gym.Env):
         return actor[0]
 
     def get_articulation(self, name):
-        all_articulations = self._scene.get_all_articulations()
-        articulation = [x for x in all_articulations if x.name == name]
+        articulation = self.entity_index.get_articulations(name)
         if len(articulation) > 1:
             raise RuntimeError(f'Not a unique name for articulation: {name}')
         elif len(articulation) == 0:
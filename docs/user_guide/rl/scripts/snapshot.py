@@ -0,0 +1,148 @@
+"""Snapshot store.
+
+Concepts:
+    - Save and restore many simulation states with physx_system.pack/unpack
+    - Delta-encode states against a base state to save memory
+    - Bound the memory usage with LRU eviction
+"""
+
+import itertools
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SnapshotStore:
+    """A bounded collection of simulation states of one PhysX system.
+
+    Each snapshot is stored as the XOR of its packed state and a base state,
+    compressed with zlib. States that stay close to the base state (e.g., branches
+    of the same episode) mostly XOR to zeros and compress very well.
+
+    Args:
+        physx_system: the PhysX system of a scene, e.g., ``scene.physx_system``.
+        base_state: the state to delta-encode against. Defaults to the current state.
+        max_bytes: the memory budget of stored snapshots (after compression).
+            The least recently used snapshots are evicted when it is exceeded.
+        compress_level: zlib compression level. Lower is faster.
+
+    Notes:
+        ``pack`` only records the physical state (poses, velocities, joint
+        positions, etc.). Drive targets and external forces (e.g., ``set_qf``)
+        are not part of a snapshot.
+    """
+
+    def __init__(self, physx_system, base_state=None, max_bytes=256 * 1024 ** 2, compress_level=1):
+        self.physx_system = physx_system
+        if base_state is None:
+            base_state = physx_system.pack()
+        self._base = np.frombuffer(base_state, dtype=np.uint8)
+        self.max_bytes = max_bytes
+        self.compress_level = compress_level
+
+        self._snapshots = OrderedDict()  # key -> (is_delta, compressed bytes)
+        self._counter = itertools.count()
+        self.nbytes = 0
+        self.num_evictions = 0
+
+    def _encode(self, state):
+        data = np.frombuffer(state, dtype=np.uint8)
+        if data.shape == self._base.shape:
+            return True, zlib.compress(np.bitwise_xor(data, self._base).tobytes(), self.compress_level)
+        # The layout of the state has changed (e.g., actors were added)
+        return False, zlib.compress(state, self.compress_level)
+
+    def _decode(self, is_delta, compressed):
+        data = zlib.decompress(compressed)
+        if is_delta:
+            return np.bitwise_xor(np.frombuffer(data, dtype=np.uint8), self._base).tobytes()
+        return data
+
+    # ---------------------------------------------------------------------------- #
+    # Save and restore
+    # ---------------------------------------------------------------------------- #
+    def save(self, key=None, state=None):
+        """Store the current state (or the given packed state) and return its key.
+
+        If ``key`` is None, a new integer key is generated.
+        """
+        if key is None:
+            key = next(self._counter)
+        if state is None:
+            state = self.physx_system.pack()
+        self.discard(key)
+        snapshot = self._encode(state)
+        self._snapshots[key] = snapshot
+        self.nbytes += len(snapshot[1])
+        self._evict()
+        return key
+
+    def get(self, key):
+        """Return the packed state of a snapshot."""
+        snapshot = self._snapshots[key]
+        self._snapshots.move_to_end(key)
+        return self._decode(*snapshot)
+
+    def restore(self, key):
+        """Restore the PhysX system to the state of a snapshot."""
+        self.physx_system.unpack(self.get(key))
+
+    def discard(self, key):
+        snapshot = self._snapshots.pop(key, None)
+        if snapshot is not None:
+            self.nbytes -= len(snapshot[1])
+
+    def clear(self):
+        self._snapshots.clear()
+        self.nbytes = 0
+
+    def _evict(self):
+        # Always keep the most recent snapshot, even if it alone exceeds the budget
+        while self.nbytes > self.max_bytes and len(self._snapshots) > 1:
+            _, (_, compressed) = self._snapshots.popitem(last=False)
+            self.nbytes -= len(compressed)
+            self.num_evictions += 1
+
+    # ---------------------------------------------------------------------------- #
+    # Utilities
+    # ---------------------------------------------------------------------------- #
+    def keys(self):
+        return list(self._snapshots.keys())
+
+    def __contains__(self, key):
+        return key in self._snapshots
+
+    def __len__(self):
+        return len(self._snapshots)
+
+
+def main():
+    from ant import AntEnv
+
+    env = AntEnv()
+    env.reset()
+    store = SnapshotStore(env._scene.physx_system, max_bytes=16 * 1024 ** 2)
+
+    # Random shooting: branch several rollouts from each node of a trajectory
+    node = store.save('root')
+    for depth in range(20):
+        best_reward, best_key = -np.inf, None
+        for branch in range(8):
+            store.restore(node)
+            _, reward, done, _ = env.step(env.action_space.sample())
+            if not done and reward > best_reward:
+                best_reward, best_key = reward, store.save()
+        if best_key is None:
+            break
+        node = best_key
+        print(f'depth {depth}: reward {best_reward:.3f}')
+
+    state_size = len(env._scene.physx_system.pack())
+    print(f'{len(store)} snapshots, {store.nbytes} bytes '
+          f'({store.nbytes / len(store) / state_size:.1%} of a full state each)')
+    env.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""Initial state bank.
+
+Concepts:
+    - Generate randomized and settled initial states offline, in parallel
+    - Save the packed states to disk
+    - Reset an environment with a single physx_system.unpack
+
+Usage:
+    python state_bank.py --env lift --num-states 10000 --num-workers 8 --output lift_states.npz
+"""
+
+import multiprocessing as mp
+
+import numpy as np
+
+
+# ---------------------------------------------------------------------------- #
+# Generation
+# ---------------------------------------------------------------------------- #
+_worker_env = None
+
+
+def _init_worker(env_fn):
+    global _worker_env
+    _worker_env = env_fn()
+
+
+def _generate(args):
+    seed, num_states, settle_steps = args
+    env = _worker_env
+    env.seed(seed)
+    np.random.seed(seed)  # some environments (e.g., LiftEnv) use the global generator
+    states = []
+    for _ in range(num_states):
+        env.reset()  # randomize the initial state
+        for _ in range(settle_steps):
+            env._scene.step()
+        states.append(np.frombuffer(env._scene.physx_system.pack(), dtype=np.uint8))
+    return states
+
+
+def generate_state_bank(env_fn, num_states, num_workers=None, settle_steps=0, seed=0, chunk_size=64):
+    """Generate a [num_states, state_size] uint8 array of packed initial states.
+
+    Each worker creates one environment by calling ``env_fn`` and collects states
+    by calling ``reset``, optionally followed by ``settle_steps`` simulation steps.
+
+    Args:
+        env_fn: a picklable callable (e.g., the class ``LiftEnv``) creating a SapienEnv.
+        num_states: the number of states to generate.
+        num_workers: the number of worker processes. Defaults to the number of CPUs.
+        settle_steps: extra simulation steps after ``reset``.
+        seed: the seed of the first chunk. Chunk ``i`` uses ``seed + i``.
+        chunk_size: the number of states generated by one task.
+    """
+    tasks = [(seed + i, min(chunk_size, num_states - start), settle_steps)
+             for i, start in enumerate(range(0, num_states, chunk_size))]
+    ctx = mp.get_context('spawn')
+    with ctx.Pool(num_workers, initializer=_init_worker, initargs=(env_fn,)) as pool:
+        states = [s for chunk in pool.imap(_generate, tasks) for s in chunk]
+
+    if len(set(len(s) for s in states)) != 1:
+        raise RuntimeError('Packed states have different sizes. Is the scene deterministic?')
+    return np.stack(states)
+
+
+# ---------------------------------------------------------------------------- #
+# Usage
+# ---------------------------------------------------------------------------- #
+class StateBank:
+    """A read-only collection of packed states."""
+
+    def __init__(self, states):
+        self.states = states
+
+    @classmethod
+    def load(cls, path):
+        return cls(np.load(path)['states'])
+
+    def save(self, path):
+        np.savez(path, states=self.states)
+
+    def sample(self, rng):
+        return self.states[rng.integers(len(self.states))].tobytes()
+
+    def __len__(self):
+        return len(self.states)
+
+
+class StateBankEnv:
+    """Wrap an environment so that ``reset`` restores a state sampled from a bank.
+
+    No randomization or settling steps are performed at reset. Other attributes are
+    forwarded to the wrapped environment. It is picklable as long as ``env_fn`` is, so
+    ``functools.partial(StateBankEnv, LiftEnv, path)`` can be used as the ``env_fn``
+    of a ``SubprocVecSapienEnv``.
+    """
+
+    def __init__(self, env_fn, bank_path):
+        self.env = env_fn()
+        self.bank = StateBank.load(bank_path)
+        state_size = len(self.env._scene.physx_system.pack())
+        if self.bank.states.shape[1] != state_size:
+            raise RuntimeError(
+                f'The state bank ({self.bank.states.shape[1]} bytes per state) does not '
+                f'match the environment ({state_size} bytes per state)')
+        self._unpack = self.env._scene.physx_system.unpack
+
+    def reset(self):
+        self._unpack(self.bank.sample(self.env.np_random))
+        return self.env._get_obs()
+
+    def __getattr__(self, name):
+        return getattr(self.env, name)
+
+
+def main():
+    import argparse
+    import time
+    from ant import AntEnv
+    from lift import LiftEnv
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--env', choices=['ant', 'lift'], default='lift')
+    parser.add_argument('--num-states', type=int, default=1024)
+    parser.add_argument('--num-workers', type=int, default=None)
+    parser.add_argument('--settle-steps', type=int, default=0,
+                        help='extra simulation steps after reset')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default=None)
+    args = parser.parse_args()
+
+    env_fn = {'ant': AntEnv, 'lift': LiftEnv}[args.env]
+    output = args.output or f'{args.env}_states.npz'
+
+    start = time.perf_counter()
+    states = generate_state_bank(env_fn, args.num_states, num_workers=args.num_workers,
+                                 settle_steps=args.settle_steps, seed=args.seed)
+    StateBank(states).save(output)
+    print(f'Generated {states.shape[0]} states of {states.shape[1]} bytes '
+          f'in {time.perf_counter() - start:.1f}s: {output}')
+
+    for env in [env_fn(), StateBankEnv(env_fn, output)]:
+        start = time.perf_counter()
+        for _ in range(1000):
+            env.reset()
+        print(f'{type(env).__name__}: {(time.perf_counter() - start):.3f} ms per reset')
+        env.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+"""Persistent URDF cache.
+
+Concepts:
+    - Pickle the builders produced by parsing a URDF file, keyed by the content of
+      the URDF and SRDF files and the settings of the loader
+    - Store the convex hulls of the collision meshes, so later loads skip loading
+      and cooking the original meshes
+    - Validate a cached entry with the content hashes of the meshes it was made from
+
+Usage:
+    loader = CachedURDFLoader('~/.cache/sapien_urdf')
+    loader.set_scene(scene)
+    loader.fix_root_link = True
+    robot = loader.load('../assets/panda/panda.urdf')
+"""
+
+import copy
+import copyreg
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+import sapien
+from sapien.wrapper.actor_builder import ActorBuilder, preprocess_mesh_file
+from sapien.wrapper.articulation_builder import LinkBuilder
+from sapien.wrapper.coacd import do_coacd
+from sapien.wrapper.urdf_loader import URDFLoader
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = '~/.cache/sapien_urdf'
+
+# Settings of URDFLoader that change the result of parsing
+_LOADER_SETTINGS = [
+    'fix_root_link', 'load_multiple_collisions_from_file', 'multiple_collisions_decomposition',
+    'multiple_collisions_decomposition_params', 'collision_is_visual', 'revolute_unwrapped', 'scale',
+    '_material', '_patch_radius', '_min_patch_radius', '_density',
+    '_link_material', '_link_patch_radius', '_link_min_patch_radius', '_link_density',
+]
+
+
+class CachedURDFLoader(URDFLoader):
+    """A URDF loader keeping parsed URDF files in a cache directory.
+
+    It is used like ``scene.create_urdf_loader()``: ``load``, ``load_multiple``
+    and ``load_file_as_articulation_builder`` all go through ``parse``, which
+    returns the cached builders when the URDF file, the SRDF file, the loader
+    settings and the collision meshes have not changed.
+
+    Collision meshes are replaced by the vertices of their convex hulls, from which
+    PhysX cooks the hulls again without loading the mesh files. Visual meshes
+    and textures are still loaded by the renderer; only their file names are cached.
+
+    Notes:
+        Cooking a hull from the vertices of a hull may drop a few nearly coplanar
+        vertices, so the collision shapes can be slightly smaller than the ones
+        of ``URDFLoader``. The first load goes through the cache as well, so all
+        processes get the same shapes. Convex hulls are attached to a link after
+        its other collision shapes.
+
+    Entries are unpickled, which can run arbitrary code, so the cache directory
+    must only be writable by trusted users.
+
+    Args:
+        cache_dir: the cache directory, shared by processes.
+    """
+
+    def __init__(self, cache_dir=None):
+        super().__init__()
+        self.cache_dir = os.path.expanduser(cache_dir or DEFAULT_CACHE_DIR)
+        self.hits = 0
+        self.misses = 0
+
+    def parse(self, urdf_file, srdf_file=None, package_dir=None):
+        urdf_file = os.path.abspath(urdf_file)
+        if srdf_file is None:
+            srdf_file = urdf_file[:-4] + "srdf"
+        path = os.path.join(self.cache_dir, self._key(urdf_file, srdf_file, package_dir) + '.pkl')
+
+        result = self._read_entry(path)
+        if result is not None:
+            self.hits += 1
+            return result
+
+        self.misses += 1
+        articulation_builders, actor_builders, cameras = super().parse(urdf_file, srdf_file, package_dir)
+        dependencies = {}
+        for builder in _all_builders(articulation_builders, actor_builders):
+            builder.collision_records = self._cook_collision_records(builder.collision_records, dependencies)
+            builder.__class__ = _HULL_BUILDERS[type(builder)]  # build the hulls from their vertices
+        self._write_entry(path, (articulation_builders, actor_builders, cameras), dependencies)
+        return articulation_builders, actor_builders, cameras
+
+    def _key(self, urdf_file, srdf_file, package_dir):
+        settings = {name: getattr(self, name) for name in _LOADER_SETTINGS}
+        header = json.dumps(dict(version=CACHE_VERSION, sapien=sapien.__version__, urdf_file=urdf_file,
+                                 package_dir=package_dir, settings=settings), sort_keys=True, default=repr)
+        h = hashlib.sha256(header.encode())
+        for path in [urdf_file, srdf_file]:
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    h.update(f.read())
+        return h.hexdigest()[:32]
+
+    # ---------------------------------------------------------------------------- #
+    # Collision meshes
+    # ---------------------------------------------------------------------------- #
+    @staticmethod
+    def _cook_collision_records(records, dependencies):
+        """Replace the mesh records by convex hull records, like ActorBuilder would build them."""
+        cooked = []
+        for r in records:
+            if r.type not in ['convex_mesh', 'multiple_convex_meshes']:
+                cooked.append(r)
+                continue
+            dependencies[r.filename] = _file_signature(r.filename)
+            try:
+                filename = preprocess_mesh_file(r.filename)
+                if r.type == 'convex_mesh':
+                    shapes = [sapien.physx.PhysxCollisionShapeConvexMesh(
+                        filename=filename, scale=np.ones(3, dtype=np.float32), material=r.material)]
+                else:
+                    if r.decomposition == 'coacd':
+                        filename = do_coacd(filename, **(r.decomposition_params or dict()))
+                    shapes = sapien.physx.PhysxCollisionShapeConvexMesh.load_multiple(
+                        filename=filename, scale=np.ones(3, dtype=np.float32), material=r.material)
+            except RuntimeError:
+                continue  # ActorBuilder also skips meshes that fail to cook
+
+            for shape in shapes:
+                r = copy.copy(r)
+                r.type = 'convex_hull'
+                r.vertices = shape.get_vertices()
+                cooked.append(r)
+        return cooked
+
+    # ---------------------------------------------------------------------------- #
+    # Cache entries
+    # ---------------------------------------------------------------------------- #
+    def _write_entry(self, path, result, dependencies):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            # The dependencies come first, to be checked before loading the builders
+            pickle.dump(dependencies, f)
+            _ScenePickler(f, self.scene).dump(result)
+        os.replace(tmp_path, path)  # readers never see a partial entry
+
+    def _read_entry(self, path):
+        try:
+            with open(path, 'rb') as f:
+                dependencies = pickle.load(f)
+                for filename, signature in dependencies.items():
+                    if not _same_file(filename, signature):
+                        return None
+                result = _SceneUnpickler(f, self.scene).load()
+            if not isinstance(result, tuple) or len(result) != 3:
+                return None
+            return result
+        except Exception:
+            # A truncated entry, or one written by another version (e.g., AttributeError
+            # or ImportError), is a miss, and parse writes the entry again
+            return None
+
+    def clear(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.pkl'):
+                os.remove(os.path.join(self.cache_dir, name))
+
+
+# ---------------------------------------------------------------------------- #
+# Builders with convex hulls
+# ---------------------------------------------------------------------------- #
+class _HullBuilder:
+    """Build the ``convex_hull`` records from their vertices, after the other records."""
+
+    def build_physx_component(self, link_parent=None):
+        records = self.collision_records
+        self.collision_records = [r for r in records if r.type != 'convex_hull']
+        try:
+            component = super().build_physx_component(link_parent)
+        finally:
+            self.collision_records = records
+
+        for r in records:
+            if r.type != 'convex_hull':
+                continue
+            shape = sapien.physx.PhysxCollisionShapeConvexMesh(
+                vertices=r.vertices, scale=np.asarray(r.scale, dtype=np.float32), material=r.material)
+            shape.local_pose = r.pose
+            shape.set_collision_groups(self.collision_groups)
+            shape.set_density(r.density)
+            shape.set_patch_radius(r.patch_radius)
+            shape.set_min_patch_radius(r.min_patch_radius)
+            component.attach(shape)
+        return component
+
+
+class _HullActorBuilder(_HullBuilder, ActorBuilder):
+    pass
+
+
+class _HullLinkBuilder(_HullBuilder, LinkBuilder):
+    pass
+
+
+_HULL_BUILDERS = {
+    ActorBuilder: _HullActorBuilder,
+    LinkBuilder: _HullLinkBuilder,
+    _HullActorBuilder: _HullActorBuilder,
+    _HullLinkBuilder: _HullLinkBuilder,
+}
+
+
+def _all_builders(articulation_builders, actor_builders):
+    return actor_builders + [b for a in articulation_builders for b in a.link_builders]
+
+
+# ---------------------------------------------------------------------------- #
+# File signatures
+# ---------------------------------------------------------------------------- #
+def _file_signature(path):
+    st = os.stat(path)
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    return dict(size=st.st_size, mtime_ns=st.st_mtime_ns, sha256=digest)
+
+
+def _same_file(path, signature):
+    """Compare a file with its signature, hashing it only if its size or time changed."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    if st.st_size != signature['size']:
+        return False
+    if st.st_mtime_ns == signature['mtime_ns']:
+        return True
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest() == signature['sha256']
+
+
+# ---------------------------------------------------------------------------- #
+# Pickling builders
+# ---------------------------------------------------------------------------- #
+def _physx_material(*args):
+    if not args:
+        return sapien.physx.get_default_material()
+    return sapien.physx.PhysxMaterial(*args)
+
+
+def _render_material(base_color, diffuse_texture):
+    material = sapien.render.RenderMaterial()
+    material.base_color = base_color
+    if diffuse_texture is not None:
+        material.diffuse_texture = diffuse_texture
+    return material
+
+
+def _reduce_physx_material(material):
+    if material == sapien.physx.get_default_material():
+        return _physx_material, ()
+    return _physx_material, (material.static_friction, material.dynamic_friction, material.restitution)
+
+
+def _reduce_render_material(material):
+    # The URDF loader only sets the base color or the diffuse texture
+    return _render_material, (list(material.base_color), material.diffuse_texture)
+
+
+def _reduce_render_texture(texture):
+    return sapien.render.RenderTexture2D, (texture.filename,)
+
+
+class _ScenePickler(pickle.Pickler):
+    dispatch_table = copyreg.dispatch_table.copy()
+    dispatch_table[sapien.physx.PhysxMaterial] = _reduce_physx_material
+    dispatch_table[sapien.render.RenderMaterial] = _reduce_render_material
+    dispatch_table[sapien.render.RenderTexture2D] = _reduce_render_texture
+
+    def __init__(self, file, scene):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.scene = scene
+
+    def persistent_id(self, obj):
+        # Builders refer to the scene they are built in, which is not saved
+        return 'scene' if obj is self.scene and obj is not None else None
+
+
+class _SceneUnpickler(pickle.Unpickler):
+    def __init__(self, file, scene):
+        super().__init__(file)
+        self.scene = scene
+
+    def persistent_load(self, pid):
+        return self.scene
+
+
+def main():
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('urdf', nargs='?', default='../assets/panda/panda.urdf')
+    parser.add_argument('--cache-dir', type=str, default=None)
+    parser.add_argument('--clear', action='store_true', help='clear the cache first')
+    args = parser.parse_args()
+
+    loader = CachedURDFLoader(args.cache_dir)
+    if args.clear:
+        loader.clear()
+
+    scene = sapien.Scene()
+    start = time.perf_counter()
+    scene.create_urdf_loader().load(args.urdf)
+    print(f'URDFLoader: {(time.perf_counter() - start) * 1000:.1f} ms')
+
+    # Each worker process starts with a new scene
+    scene = sapien.Scene()
+    loader.set_scene(scene)
+    start = time.perf_counter()
+    loader.load(args.urdf)
+    print(f'CachedURDFLoader: {(time.perf_counter() - start) * 1000:.1f} ms '
+          f'({"hit" if loader.hits else "miss"}, {loader.cache_dir})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+"""Vectorized environment.
+
+Concepts:
+    - Step several SapienEnv instances (one scene each) with a single call
+    - Stack observations, rewards and done flags into preallocated arrays
+    - Automatically reset finished sub-environments
+    - Run sub-environments in worker processes with shared-memory buffers
+"""
+
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class VecSapienEnv:
+    """Run a batch of SapienEnv instances in the current process.
+
+    Args:
+        env_fns: a list of callables, each of which creates a SapienEnv.
+
+    Notes:
+        The arrays returned by ``reset`` and ``step`` are owned by this object and
+        are overwritten in place by the next call. Copy them if you need to keep them.
+    """
+
+    def __init__(self, env_fns):
+        self.envs = [env_fn() for env_fn in env_fns]
+        self.num_envs = len(self.envs)
+        assert self.num_envs > 0, 'At least one environment is required'
+
+        self.observation_space = self.envs[0].observation_space
+        self.action_space = self.envs[0].action_space
+
+        obs_dim = self.observation_space.shape[0]
+        self._obs = np.zeros((self.num_envs, obs_dim), dtype=np.float32)
+        self._rewards = np.zeros(self.num_envs, dtype=np.float32)
+        self._dones = np.zeros(self.num_envs, dtype=bool)
+
+        # Bind methods once to avoid attribute lookups in the stepping loop
+        self._env_steps = [env.step for env in self.envs]
+        self._env_resets = [env.reset for env in self.envs]
+
+    # ---------------------------------------------------------------------------- #
+    # Batched gym-style functions
+    # ---------------------------------------------------------------------------- #
+    def seed(self, seed=None):
+        if seed is None:
+            return [env.seed()[0] for env in self.envs]
+        return [env.seed(seed + i)[0] for i, env in enumerate(self.envs)]
+
+    def reset(self):
+        obs = self._obs
+        for i, env_reset in enumerate(self._env_resets):
+            obs[i] = env_reset()
+        self._dones[:] = False
+        return obs
+
+    def step(self, actions):
+        """Step all sub-environments with a [num_envs, action_dim] array of actions.
+
+        Finished sub-environments are reset immediately. In that case, the returned
+        observation is the first observation of the new episode, and the last
+        observation of the finished episode is stored in ``info['terminal_observation']``.
+        """
+        actions = np.asarray(actions, dtype=np.float32)
+        assert actions.shape == (self.num_envs,) + self.action_space.shape, \
+            'Invalid shape of actions: {}'.format(actions.shape)
+
+        obs, rewards, dones = self._obs, self._rewards, self._dones
+        infos = []
+        for i, (env_step, env_reset) in enumerate(zip(self._env_steps, self._env_resets)):
+            o, r, d, info = env_step(actions[i])
+            if d:
+                info['terminal_observation'] = np.array(o, dtype=np.float32)
+                o = env_reset()
+            obs[i] = o
+            rewards[i] = r
+            dones[i] = d
+            infos.append(info)
+        return obs, rewards, dones, infos
+
+    def close(self):
+        for env in self.envs:
+            env.close()
+
+    def __len__(self):
+        return self.num_envs
+
+
+def _create_shared_array(shape, dtype):
+    nbytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+    shm = shared_memory.SharedMemory(create=True, size=nbytes)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _attach_shared_array(name, shape, dtype):
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _worker(remote, parent_remote, env_fn, env_ids):
+    parent_remote.close()
+    envs = [env_fn() for _ in env_ids]
+    remote.send((envs[0].observation_space, envs[0].action_space))
+
+    # Attach the buffers allocated by the main process
+    shms, arrays = [], []
+    for name, shape, dtype in remote.recv():
+        shm, array = _attach_shared_array(name, shape, dtype)
+        shms.append(shm)
+        arrays.append(array)
+    actions, obs, rewards, dones, terminal_obs = arrays
+
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == 'step':
+                for env, i in zip(envs, env_ids):
+                    o, r, d, _ = env.step(actions[i])
+                    if d:
+                        terminal_obs[i] = o
+                        o = env.reset()
+                    obs[i] = o
+                    rewards[i] = r
+                    dones[i] = d
+                remote.send(None)
+            elif cmd == 'reset':
+                for env, i in zip(envs, env_ids):
+                    obs[i] = env.reset()
+                    dones[i] = False
+                remote.send(None)
+            elif cmd == 'seed':
+                remote.send([env.seed(None if data is None else data + i)[0]
+                             for env, i in zip(envs, env_ids)])
+            elif cmd == 'close':
+                break
+            else:
+                raise NotImplementedError('Unsupported command {}.'.format(cmd))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for env in envs:
+            env.close()
+        del actions, obs, rewards, dones, terminal_obs, arrays
+        for shm in shms:
+            shm.close()
+        remote.close()
+
+
+class SubprocVecSapienEnv:
+    """Run a batch of SapienEnv instances in worker processes.
+
+    PhysX steps each CPU scene on a single thread, so worker processes are
+    required to use more than one core. Each worker owns ``num_envs / num_workers``
+    scenes. Actions, observations, rewards and done flags are exchanged through
+    preallocated shared-memory arrays; the pipes only carry short commands.
+
+    Args:
+        env_fn: a picklable callable (e.g., the class ``AntEnv``) creating a SapienEnv.
+        num_envs: the total number of sub-environments.
+        num_workers: the number of worker processes. Defaults to the number of CPUs.
+        start_method: the multiprocessing start method.
+
+    Notes:
+        Only ``info['terminal_observation']`` is passed back to the main process.
+        Other entries of ``info`` returned by the sub-environments are discarded.
+    """
+
+    def __init__(self, env_fn, num_envs, num_workers=None, start_method='spawn'):
+        if num_workers is None:
+            num_workers = mp.cpu_count()
+        num_workers = min(num_workers, num_envs)
+        self.num_envs = num_envs
+        self.num_workers = num_workers
+
+        ctx = mp.get_context(start_method)
+        self._remotes, self._processes = [], []
+        for env_ids in np.array_split(np.arange(num_envs), num_workers):
+            remote, work_remote = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker, args=(work_remote, remote, env_fn, env_ids.tolist()), daemon=True)
+            process.start()
+            work_remote.close()
+            self._remotes.append(remote)
+            self._processes.append(process)
+
+        spaces = [remote.recv() for remote in self._remotes]
+        self.observation_space, self.action_space = spaces[0]
+
+        obs_dim = self.observation_space.shape[0]
+        layouts = [
+            (num_envs,) + self.action_space.shape,  # actions
+            (num_envs, obs_dim),  # observations
+            (num_envs,),  # rewards
+            (num_envs,),  # dones
+            (num_envs, obs_dim),  # terminal observations
+        ]
+        dtypes = [np.float32, np.float32, np.float32, bool, np.float32]
+        self._shms = []
+        arrays = []
+        for shape, dtype in zip(layouts, dtypes):
+            shm, array = _create_shared_array(shape, dtype)
+            self._shms.append(shm)
+            arrays.append(array)
+        self._actions, self._obs, self._rewards, self._dones, self._terminal_obs = arrays
+
+        handles = [(shm.name, shape, dtype) for shm, shape, dtype in zip(self._shms, layouts, dtypes)]
+        for remote in self._remotes:
+            remote.send(handles)
+        self.closed = False
+
+    # ---------------------------------------------------------------------------- #
+    # Batched gym-style functions
+    # ---------------------------------------------------------------------------- #
+    def seed(self, seed=None):
+        for remote in self._remotes:
+            remote.send(('seed', seed))
+        return [s for remote in self._remotes for s in remote.recv()]
+
+    def reset(self):
+        for remote in self._remotes:
+            remote.send(('reset', None))
+        for remote in self._remotes:
+            remote.recv()
+        return self._obs
+
+    def step_async(self, actions):
+        self._actions[:] = actions
+        for remote in self._remotes:
+            remote.send(('step', None))
+
+    def step_wait(self):
+        for remote in self._remotes:
+            remote.recv()
+        infos = [{'terminal_observation': self._terminal_obs[i].copy()} if d else {}
+                 for i, d in enumerate(self._dones)]
+        return self._obs, self._rewards, self._dones, infos
+
+    def step(self, actions):
+        """Same as ``VecSapienEnv.step``, but sub-environments run in parallel."""
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        if self.closed:
+            return
+        for remote in self._remotes:
+            remote.send(('close', None))
+        for process in self._processes:
+            process.join()
+        for remote in self._remotes:
+            remote.close()
+        del self._actions, self._obs, self._rewards, self._dones, self._terminal_obs
+        for shm in self._shms:
+            shm.close()
+            shm.unlink()
+        self.closed = True
+
+    def __len__(self):
+        return self.num_envs
+
+
+def main():
+    import argparse
+    from ant import AntEnv
+    from lift import LiftEnv
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--env', choices=['ant', 'lift'], default='ant')
+    parser.add_argument('--num-envs', type=int, default=16)
+    parser.add_argument('--num-workers', type=int, default=0,
+                        help='number of worker processes (0 to run in the current process)')
+    args = parser.parse_args()
+
+    env_fn = {'ant': AntEnv, 'lift': LiftEnv}[args.env]
+    num_envs = args.num_envs
+    if args.num_workers > 0:
+        env = SubprocVecSapienEnv(env_fn, num_envs, num_workers=args.num_workers)
+    else:
+        env = VecSapienEnv([env_fn] * num_envs)
+    env.seed(0)
+    obs = env.reset()
+    print('Observation batch:', obs.shape)
+    for step in range(1000):
+        actions = np.stack([env.action_space.sample() for _ in range(num_envs)])
+        obs, rewards, dones, infos = env.step(actions)
+        if dones.any():
+            print(f'Sub-environments {np.flatnonzero(dones)} are done at step {step}')
+    env.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 import sapien
+from pacing import RealtimePacer
 
 
 def demo(fix_root_link, balance_passive_force):
@@ -28,8 +29,10 @@ def demo(fix_root_link, balance_passive_force):
     # for link in robot.links:
     #     link.disable_gravity = True
 
+    # Run the physics in real time, and render at most 60 frames per second
+    pacer = RealtimePacer(physics_rate=1 / scene.get_timestep(), display_rate=60, report_interval=5.0)
     while not viewer.closed:
-        for _ in range(4):  # render every 4 steps
+        for _ in pacer.steps():
             if balance_passive_force:
                 qf = robot.compute_passive_force(
                     gravity=True,
@@ -39,6 +42,7 @@ def demo(fix_root_link, balance_passive_force):
             scene.step()
         scene.update_render()
         viewer.render()
+        pacer.frame_done()
 
 
 def main():
@@ -0,0 +1,199 @@
+"""Real-time pacing of a viewer loop.
+
+Concepts:
+    - Decouple the physics rate (1 / timestep) from the display rate
+    - Choose the number of substeps before each frame from the wall clock, so the
+      simulation runs at a target real-time factor on fast and slow machines
+    - Report the achieved real-time factor and the dropped frames
+
+Usage:
+    pacer = RealtimePacer(physics_rate=1 / scene.get_timestep(), display_rate=60)
+    while not viewer.closed:
+        for _ in pacer.steps():
+            scene.step()
+        scene.update_render()
+        viewer.render()
+        pacer.frame_done()
+"""
+
+import time
+
+
+class RealtimePacer:
+    """Schedule physics substeps and frames of a viewer loop.
+
+    Before each frame, ``steps()`` yields as many substeps as needed for the
+    simulated time to catch up with the wall-clock time at which the frame is
+    displayed, multiplied by ``realtime_factor``. Slow rendering therefore results
+    in more substeps per frame instead of a slower simulation, and fast rendering
+    does not produce more frames than ``display_rate``.
+
+    When even the physics cannot keep up, at most ``max_frame_time`` seconds of
+    substeps run before each frame so that the viewer stays responsive, and the
+    missing simulated time is given up instead of being caught up later.
+
+    Args:
+        physics_rate: the number of substeps per simulated second, i.e., 1 / timestep.
+        display_rate: the target number of frames per second.
+        realtime_factor: the target ratio of simulated time to wall-clock time.
+        max_frame_time: the maximum wall-clock time of the substeps of a frame.
+        report_interval: if not None, print a report every ``report_interval`` seconds.
+    """
+
+    def __init__(self, physics_rate, display_rate=60.0, realtime_factor=1.0, max_frame_time=0.1,
+                 report_interval=None):
+        self.timestep = 1.0 / physics_rate
+        self.frame_period = 1.0 / display_rate
+        self.realtime_factor = realtime_factor
+        self.max_frame_time = max_frame_time
+        self.report_interval = report_interval
+
+        self.num_steps = 0
+        self.num_frames = 0
+        self.num_dropped_frames = 0
+        self.step_time = None  # moving average of the wall-clock time of a substep
+        self.render_time = 0.0  # moving average of the wall-clock time from the last substep to frame_done
+
+        self._start = None
+        self._origin = None  # wall-clock time at which the simulated time is 0
+        self._deadline = None  # wall-clock time at which the next frame is due
+        self._window = None  # (time, num_steps, num_frames, num_dropped_frames) at the last report
+        self._steps_begin = None
+        self._steps_end = None
+        self._num_frame_steps = 0
+
+    def _restart(self, now):
+        self._start = self._origin = now - self.num_steps * self.timestep / self.realtime_factor
+        self._deadline = now + self.frame_period
+        self._window = (now, self.num_steps, self.num_frames, self.num_dropped_frames)
+
+    @property
+    def sim_time(self):
+        return self.num_steps * self.timestep
+
+    # ---------------------------------------------------------------------------- #
+    # Scheduling
+    # ---------------------------------------------------------------------------- #
+    def substeps(self, paused=False):
+        """Return the number of substeps to simulate before the next frame.
+
+        With ``paused=True``, no substep is simulated and the simulated time does
+        not fall behind. Call ``substeps_done`` after the substeps.
+        """
+        now = time.perf_counter()
+        if self._origin is None:
+            self._restart(now)
+        self._steps_begin = now
+
+        display_time = max(now + self.render_time, self._deadline)
+        if paused:
+            self._origin = display_time - self.sim_time / self.realtime_factor
+            self._num_frame_steps = 0
+            return 0
+
+        target = (display_time - self._origin) * self.realtime_factor
+        n = int((target - self.sim_time) / self.timestep)
+        max_steps = n if self.step_time is None else max(1, int(self.max_frame_time / self.step_time))
+        if n > max_steps:
+            n = max_steps
+            # Give up the simulated time that cannot be caught up
+            self._origin = display_time - (self.sim_time + n * self.timestep) / self.realtime_factor
+        self.num_steps += n
+        self._num_frame_steps = n
+        return n
+
+    def substeps_done(self):
+        """Mark the end of the substeps, separating the physics time from the rendering time."""
+        self._steps_end = time.perf_counter()
+        n = self._num_frame_steps
+        if n > 0:
+            step_time = (self._steps_end - self._steps_begin) / n
+            self.step_time = step_time if self.step_time is None else 0.9 * self.step_time + 0.1 * step_time
+
+    def steps(self, paused=False):
+        """Yield once for every substep to simulate before the next frame."""
+        for _ in range(self.substeps(paused)):
+            yield
+        self.substeps_done()
+
+    def frame_done(self):
+        """Wait until the frame is due and count the frames displayed too late."""
+        now = time.perf_counter()
+        if self._origin is None:
+            self._restart(now)
+        if self._steps_begin is not None:
+            if self._steps_end is None:
+                self.substeps_done()  # without substeps_done, rendering is timed as physics
+            else:
+                self.render_time = 0.9 * self.render_time + 0.1 * (now - self._steps_end)
+            self._steps_begin = self._steps_end = None
+
+        if now < self._deadline:
+            time.sleep(self._deadline - now)
+            self._deadline += self.frame_period
+        else:
+            # The previous frame stays on screen for every display period missed
+            missed = int((now - self._deadline) / self.frame_period) + 1
+            self.num_dropped_frames += missed
+            self._deadline += (missed + 1) * self.frame_period
+        self.num_frames += 1
+
+        if self.report_interval is not None and now - self._window[0] >= self.report_interval:
+            print(self.report())
+
+    # ---------------------------------------------------------------------------- #
+    # Reports
+    # ---------------------------------------------------------------------------- #
+    def stats(self, since_last_report=False):
+        """Return the achieved real-time factor, frame rate and dropped frames.
+
+        The statistics cover the whole run, or the time since the last report.
+        """
+        now = time.perf_counter()
+        if self._start is None:
+            return dict(realtime_factor=0.0, fps=0.0, dropped_frames=0, substeps_per_frame=0.0)
+        if since_last_report:
+            start, num_steps, num_frames, num_dropped_frames = self._window
+        else:
+            start, num_steps, num_frames, num_dropped_frames = self._start, 0, 0, 0
+        elapsed = max(now - start, 1e-9)
+        num_steps = self.num_steps - num_steps
+        num_frames = self.num_frames - num_frames
+        return dict(
+            realtime_factor=num_steps * self.timestep / elapsed,
+            fps=num_frames / elapsed,
+            dropped_frames=self.num_dropped_frames - num_dropped_frames,
+            substeps_per_frame=num_steps / max(num_frames, 1),
+        )
+
+    def report(self):
+        stats = self.stats(since_last_report=True)
+        self._window = (time.perf_counter(), self.num_steps, self.num_frames, self.num_dropped_frames)
+        return ('real-time factor {realtime_factor:.2f}, {fps:.1f} fps, {substeps_per_frame:.1f} substeps/frame, '
+                '{dropped_frames} dropped frames'.format(**stats))
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--physics-rate", type=float, default=2000.0)
+    parser.add_argument("--display-rate", type=float, default=60.0)
+    parser.add_argument("--render-time", type=float, default=0.03,
+                        help="simulated rendering time of a frame, in seconds")
+    parser.add_argument("--duration", type=float, default=3.0)
+    args = parser.parse_args()
+
+    # A loop without a viewer: rendering is simulated by sleeping
+    pacer = RealtimePacer(args.physics_rate, args.display_rate, report_interval=1.0)
+    start = time.perf_counter()
+    while time.perf_counter() - start < args.duration:
+        for _ in pacer.steps():
+            pass
+        time.sleep(args.render_time)
+        pacer.frame_done()
+    print(pacer.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import sapien
 import numpy as np
+from pacing import RealtimePacer
 
 
 class SimplePID:
@@ -89,8 +90,9 @@ def demo(use_internal_drive, use_external_pid):
         for i, joint in enumerate(active_joints):
             pids.append(SimplePID(*pid_parameters[i]))
 
+    pacer = RealtimePacer(physics_rate=1 / scene.get_timestep(), display_rate=60, report_interval=5.0)
     while not viewer.closed:
-        for _ in range(4):  # render every 4 steps
+        for _ in pacer.steps():
             qf = robot.compute_passive_force(
                 gravity=True,
                 coriolis_and_centrifugal=True,
@@ -104,6 +106,7 @@ def demo(use_internal_drive, use_external_pid):
             scene.step()
         scene.update_render()
         viewer.render()
+        pacer.frame_done()
 
 
 def main():
@@ -0,0 +1,180 @@
+"""Array-backed PID controllers.
+
+Concepts:
+    - Store the gains and states of many PID controllers in (num_envs, dof) arrays
+    - Compute all outputs with a few in-place NumPy operations
+    - Anti-windup by clamping the integral, and per-joint output limits
+"""
+
+import numpy as np
+import sapien
+from pacing import RealtimePacer
+
+
+class PIDBank:
+    """PID controllers of ``dof`` joints in ``num_envs`` environments.
+
+    The output is computed in the same way as ``SimplePID`` in ``pid.py``:
+    ``kp * error + ki * integral + kd * (error - last_error) / dt``.
+
+    Args:
+        kp, ki, kd: gains, broadcastable to (num_envs, dof), e.g., one gain per joint.
+        num_envs: the number of environments.
+        dof: the number of joints of each environment. Defaults to the last
+            dimension of the gains, and must be given if they are all scalars.
+        integral_limit: the absolute limit of the integral of the error
+            (anti-windup), broadcastable to (num_envs, dof).
+        output_limit: the absolute limit of the output, e.g., the maximum joint
+            force, broadcastable to (num_envs, dof).
+    """
+
+    def __init__(self, kp, ki, kd, num_envs=1, dof=None, integral_limit=np.inf, output_limit=np.inf):
+        if dof is None:
+            dims = np.shape(kp)[-1:] + np.shape(ki)[-1:] + np.shape(kd)[-1:]
+            if not dims:
+                raise RuntimeError('dof must be given when all the gains are scalars.')
+            dof = max(dims)
+        shape = (num_envs, dof)
+        self.shape = shape
+        self.kp = np.array(np.broadcast_to(kp, shape), dtype=np.float64)
+        self.ki = np.array(np.broadcast_to(ki, shape), dtype=np.float64)
+        self.kd = np.array(np.broadcast_to(kd, shape), dtype=np.float64)
+        self.integral_limit = np.array(np.broadcast_to(integral_limit, shape), dtype=np.float64)
+        self.output_limit = np.array(np.broadcast_to(output_limit, shape), dtype=np.float64)
+
+        self.integral = np.zeros(shape)
+        self.last_error = np.zeros(shape)
+        # Preallocated buffers, so that compute does not allocate
+        self._error = np.zeros(shape)
+        self._tmp = np.zeros(shape)
+        self._out = np.zeros(shape)
+
+    def reset(self, env_ids=None):
+        """Reset the integral and the last error of some (or all) environments."""
+        if env_ids is None:
+            env_ids = slice(None)
+        self.integral[env_ids] = 0
+        self.last_error[env_ids] = 0
+
+    def compute(self, target, current, dt, out=None):
+        """Return the outputs of all controllers as a (num_envs, dof) array.
+
+        Args:
+            target: target positions, broadcastable to (num_envs, dof).
+            current: current positions, broadcastable to (num_envs, dof).
+            dt: the time since the last call.
+            out: the array to write the outputs into. Defaults to an internal buffer,
+                which is overwritten by the next call.
+        """
+        if out is None:
+            out = self._out
+        error, tmp = self._error, self._tmp
+        np.subtract(target, current, out=error)
+
+        # P
+        np.multiply(self.kp, error, out=out)
+
+        # I (clamped integral)
+        np.multiply(error, dt, out=tmp)
+        self.integral += tmp
+        np.clip(self.integral, -self.integral_limit, self.integral_limit, out=self.integral)
+        np.multiply(self.ki, self.integral, out=tmp)
+        out += tmp
+
+        # D
+        np.subtract(error, self.last_error, out=tmp)
+        tmp *= self.kd
+        tmp /= dt
+        out += tmp
+        self.last_error[:] = error
+
+        np.clip(out, -self.output_limit, self.output_limit, out=out)
+        return out
+
+
+def benchmark(num_envs, dof=13, num_steps=2000):
+    import time
+    from pid import SimplePID, pid_forward
+
+    rng = np.random.default_rng(0)
+    gains = rng.uniform(0.1, 10, size=(3, dof))
+    target = rng.uniform(-1, 1, size=(num_envs, dof))
+    current = rng.uniform(-1, 1, size=(num_envs, dof))
+    dt = 1 / 2000.0
+
+    pids = [[SimplePID(*gains[:, j]) for j in range(dof)] for _ in range(num_envs)]
+    start = time.perf_counter()
+    for _ in range(num_steps):
+        for i in range(num_envs):
+            pid_forward(pids[i], target[i], current[i], dt)
+    simple_time = (time.perf_counter() - start) / num_steps
+
+    bank = PIDBank(*gains, num_envs=num_envs)
+    start = time.perf_counter()
+    for _ in range(num_steps):
+        bank.compute(target, current, dt)
+    bank_time = (time.perf_counter() - start) / num_steps
+
+    print(f'{num_envs} envs x {dof} joints: SimplePID {simple_time * 1e6:.1f}us, '
+          f'PIDBank {bank_time * 1e6:.1f}us per step')
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--benchmark", action="store_true",
+                        help="compare with SimplePID without simulation")
+    parser.add_argument("--num-envs", type=int, default=256)
+    args = parser.parse_args()
+
+    if args.benchmark:
+        for num_envs in [1, 16, args.num_envs]:
+            benchmark(num_envs)
+        return
+
+    scene = sapien.Scene()
+    scene.set_timestep(1 / 2000.0)
+    scene.add_ground(0)
+
+    scene.set_ambient_light([0.5, 0.5, 0.5])
+    scene.add_directional_light([0, 1, -1], [0.5, 0.5, 0.5])
+
+    viewer = scene.create_viewer()
+    viewer.set_camera_xyz(x=-2, y=0, z=1)
+    viewer.set_camera_rpy(r=0, p=-0.3, y=0)
+
+    loader = scene.create_urdf_loader()
+    loader.fix_root_link = True
+    robot = loader.load("../assets/jaco2/jaco2.urdf")
+    robot.set_root_pose(sapien.Pose([0, 0, 0], [1, 0, 0, 0]))
+
+    arm_zero_qpos = [0, 3.14, 0, 3.14, 0, 3.14, 0]
+    gripper_init_qpos = [0, 0, 0, 0, 0, 0]
+    robot.set_qpos(arm_zero_qpos + gripper_init_qpos)
+    arm_target_qpos = [4.71, 2.84, 0.0, 0.75, 4.62, 4.48, 4.88]
+    target_qpos = np.array(arm_target_qpos + gripper_init_qpos)
+
+    # The same gains as the external PID in pid.py
+    pids = PIDBank(
+        kp=[40, 40, 40, 20, 5, 5, 5] + [0.1] * 6,
+        ki=[5, 5, 5, 5, 0.8, 0.8, 0.8] + [0] * 6,
+        kd=[2, 2, 2, 2, 2, 2, 0.4] + [0.02] * 6,
+        integral_limit=1.0,
+    )
+    dt = scene.get_timestep()
+
+    pacer = RealtimePacer(physics_rate=1 / dt, display_rate=60, report_interval=5.0)
+    while not viewer.closed:
+        for _ in pacer.steps():
+            qf = robot.compute_passive_force(gravity=True, coriolis_and_centrifugal=True)
+            qf += pids.compute(target_qpos, robot.get_qpos(), dt)[0]
+            robot.set_qf(qf)
+            scene.step()
+        scene.update_render()
+        viewer.render()
+        pacer.frame_done()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""Substep controllers.
+
+Concepts:
+    - Register controllers once instead of writing a Python loop around scene.step()
+    - Delegate PD control to the PhysX internal drives
+    - Fold the integral term of a PID controller into the drive target
+    - Stop a frame-skip loop early with termination predicates
+    - Reuse the passive force while the robot stays still
+"""
+
+import functools
+
+import numpy as np
+import sapien
+from pacing import RealtimePacer
+
+
+class PassiveForceCache:
+    """Compute the passive force of an articulation, reusing the last result while
+    the joint positions and velocities stay within a tolerance.
+
+    Args:
+        robot: the articulation.
+        gravity, coriolis_and_centrifugal: passed to ``compute_passive_force``.
+        qpos_tol: recompute when the joint positions have moved by more than
+            ``qpos_tol`` (Euclidean norm) since the last computation.
+        qvel_tol: recompute when the joint velocities have changed by more than
+            ``qvel_tol``. Only checked with ``coriolis_and_centrifugal``, since the
+            other forces do not depend on the velocities. None disables the check,
+            which halves its cost but returns stale Coriolis and centrifugal forces
+            while the robot moves within ``qpos_tol``.
+        max_staleness: recompute after reusing the result ``max_staleness`` times.
+
+    The returned joint force is read-only, since it is shared by the calls reusing it.
+
+    Notes:
+        Checking the state costs a few microseconds, so the cache pays off when
+        ``compute_passive_force`` is more expensive, e.g., with many links or
+        with ``coriolis_and_centrifugal``.
+    """
+
+    def __init__(self, robot: sapien.physx.PhysxArticulation, gravity=True, coriolis_and_centrifugal=True,
+                 qpos_tol=1e-3, qvel_tol=1e-2, max_staleness=100):
+        self.robot = robot
+        self.gravity = gravity
+        self.coriolis_and_centrifugal = coriolis_and_centrifugal
+        self._qpos_tol2 = qpos_tol ** 2
+        self._qvel_tol2 = None if qvel_tol is None else qvel_tol ** 2
+        self.max_staleness = max_staleness
+        self._compute_passive_force = robot.compute_passive_force
+        self._get_qpos = robot.get_qpos
+        self._get_qvel = robot.get_qvel
+
+        self.hits = 0
+        self.misses = 0
+        self._qf = None
+        self._qpos = None
+        self._qvel = None
+        self._staleness = 0
+
+    def invalidate(self):
+        """Force a recomputation, e.g., after ``set_qpos``."""
+        self._qf = None
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __call__(self):
+        qpos = self._get_qpos()
+        qvel = None
+        if self.coriolis_and_centrifugal and self._qvel_tol2 is not None:
+            qvel = self._get_qvel()
+        if self._qf is not None and self._staleness < self.max_staleness:
+            d = qpos - self._qpos
+            if d @ d <= self._qpos_tol2:
+                if qvel is None:
+                    self.hits += 1
+                    self._staleness += 1
+                    return self._qf
+                d = qvel - self._qvel
+                if d @ d <= self._qvel_tol2:
+                    self.hits += 1
+                    self._staleness += 1
+                    return self._qf
+
+        self.misses += 1
+        self._staleness = 0
+        self._qpos, self._qvel = qpos, qvel
+        self._qf = self._compute_passive_force(
+            gravity=self.gravity, coriolis_and_centrifugal=self.coriolis_and_centrifugal)
+        self._qf.flags.writeable = False
+        return self._qf
+
+
+class GravityCompensation:
+    """Balance the passive force of an articulation.
+
+    Args:
+        robot: the articulation.
+        coriolis_and_centrifugal: whether to also compensate the Coriolis and
+            centrifugal forces.
+        update_every: recompute the passive force every ``update_every`` substeps.
+            The joint force set by ``set_qf`` persists in between.
+        cache: if True, reuse the last passive force while the robot stays still
+            (see ``PassiveForceCache``). ``cache_kwargs`` are passed to the cache.
+    """
+
+    per_substep = True
+
+    def __init__(self, robot: sapien.physx.PhysxArticulation, coriolis_and_centrifugal=True, update_every=1,
+                 cache=False, **cache_kwargs):
+        self.robot = robot
+        self.coriolis_and_centrifugal = coriolis_and_centrifugal
+        self.update_every = update_every
+        self.cache = None
+        if cache:
+            self.cache = PassiveForceCache(
+                robot, coriolis_and_centrifugal=coriolis_and_centrifugal, **cache_kwargs)
+            self._compute = self.cache
+        else:
+            self._compute = functools.partial(
+                robot.compute_passive_force, gravity=True, coriolis_and_centrifugal=coriolis_and_centrifugal)
+
+    def qf(self, substep):
+        if substep % self.update_every != 0:
+            return None
+        return self._compute()
+
+
+class JointPD:
+    """Joint-space PD control with the PhysX internal drives.
+
+    The drive is integrated into the PhysX solver, so there is no Python code
+    running at every substep.
+    """
+
+    per_substep = False
+
+    def __init__(self, robot: sapien.physx.PhysxArticulation, stiffness, damping, force_limit=1e10, mode='force'):
+        self.robot = robot
+        self.joints = robot.get_active_joints()
+        stiffness = np.broadcast_to(stiffness, len(self.joints))
+        damping = np.broadcast_to(damping, len(self.joints))
+        for joint, kp, kd in zip(self.joints, stiffness, damping):
+            joint.set_drive_property(stiffness=kp, damping=kd, force_limit=force_limit, mode=mode)
+        self._set_drive_targets = [joint.set_drive_target for joint in self.joints]
+        self.target = robot.get_qpos()
+
+    def set_target(self, target):
+        self.target = np.asarray(target, dtype=np.float32)
+
+    def _apply(self, target):
+        for set_drive_target, t in zip(self._set_drive_targets, target):
+            set_drive_target(t)
+
+    def before_substeps(self, num_substeps, dt):
+        self._apply(self.target)
+
+
+class JointPID(JointPD):
+    """Joint-space PID control with the PhysX internal drives.
+
+    The P and D terms are computed by the internal drives. The I term is
+    accumulated once per ``SubstepRunner.step`` call, and added to the drive
+    target as ``ki / kp * integral``, which produces the same force as an
+    explicit integral term as long as the drive is not saturated. Joints with
+    ``kp == 0`` have no stiffness to carry the I term, so their ``ki`` must be 0.
+
+    Args:
+        integral_limit: the absolute limit of the accumulated error of each joint
+            (anti-windup).
+    """
+
+    def __init__(self, robot, kp, ki, kd, integral_limit=np.inf, force_limit=1e10, mode='force'):
+        super().__init__(robot, kp, kd, force_limit=force_limit, mode=mode)
+        kp = np.broadcast_to(np.asarray(kp, dtype=np.float32), (robot.dof,))
+        ki = np.broadcast_to(np.asarray(ki, dtype=np.float32), (robot.dof,))
+        invalid = np.flatnonzero((kp == 0) & (ki != 0))
+        if len(invalid):
+            raise ValueError('ki must be 0 for the joints with kp = 0, got ki = {} for joints {}.'.format(
+                ki[invalid].tolist(), invalid.tolist()))
+        self._ki_over_kp = np.divide(ki, kp, out=np.zeros(robot.dof, dtype=np.float32), where=kp != 0)
+        self.integral_limit = integral_limit
+        self.integral = np.zeros(robot.dof, dtype=np.float32)
+
+    def reset(self):
+        self.integral[:] = 0
+
+    def before_substeps(self, num_substeps, dt):
+        error = self.target - self.robot.get_qpos()
+        self.integral += error * (num_substeps * dt)
+        np.clip(self.integral, -self.integral_limit, self.integral_limit, out=self.integral)
+        self._apply(self.target + self._ki_over_kp * self.integral)
+
+
+class SubstepRunner:
+    """Run a number of substeps of a scene with registered controllers.
+
+    Controllers with ``per_substep = False`` are applied once before the substeps
+    (``before_substeps``). Controllers with ``per_substep = True`` return a joint
+    force (``qf``) for their articulation, which is summed and set once per
+    substep. Termination predicates are checked every ``check_every`` substeps.
+
+    Notes:
+        SAPIEN steps a scene with one ``scene.step()`` call per substep. The
+        runner keeps the loop around it as short as possible: with only drive-based
+        controllers, the loop contains nothing but ``scene.step()``.
+    """
+
+    def __init__(self, scene: sapien.Scene):
+        self.scene = scene
+        self._before_substeps = []
+        self._qf_controllers = {}  # articulation -> [controller]
+        self._terminations = []
+
+    def add_controller(self, controller):
+        if controller.per_substep:
+            self._qf_controllers.setdefault(controller.robot, []).append(controller)
+        else:
+            self._before_substeps.append(controller)
+        return controller
+
+    def add_termination(self, predicate, check_every=1):
+        """``predicate()`` returns True to stop the remaining substeps."""
+        self._terminations.append((predicate, check_every))
+
+    def step(self, num_substeps):
+        """Simulate up to ``num_substeps`` substeps and return the number of substeps run."""
+        scene_step = self.scene.step
+        dt = self.scene.get_timestep()
+        for controller in self._before_substeps:
+            controller.before_substeps(num_substeps, dt)
+
+        if not self._qf_controllers and not self._terminations:
+            for _ in range(num_substeps):
+                scene_step()
+            return num_substeps
+
+        qf_controllers = [(robot.set_qf, controllers) for robot, controllers in self._qf_controllers.items()]
+        for substep in range(num_substeps):
+            for set_qf, controllers in qf_controllers:
+                qf = None
+                for controller in controllers:
+                    f = controller.qf(substep)
+                    if f is not None:
+                        qf = f if qf is None else qf + f
+                if qf is not None:
+                    set_qf(qf)
+            scene_step()
+            for predicate, check_every in self._terminations:
+                if (substep + 1) % check_every == 0 and predicate():
+                    return substep + 1
+        return num_substeps
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--compensation-every", type=int, default=1,
+                        help="recompute the passive force every n substeps")
+    args = parser.parse_args()
+
+    scene = sapien.Scene()
+    scene.set_timestep(1 / 2000.0)
+    scene.add_ground(0)
+
+    scene.set_ambient_light([0.5, 0.5, 0.5])
+    scene.add_directional_light([0, 1, -1], [0.5, 0.5, 0.5])
+
+    viewer = scene.create_viewer()
+    viewer.set_camera_xyz(x=-2, y=0, z=1)
+    viewer.set_camera_rpy(r=0, p=-0.3, y=0)
+
+    loader = scene.create_urdf_loader()
+    loader.fix_root_link = True
+    robot = loader.load("../assets/jaco2/jaco2.urdf")
+    robot.set_root_pose(sapien.Pose([0, 0, 0], [1, 0, 0, 0]))
+
+    arm_zero_qpos = [0, 3.14, 0, 3.14, 0, 3.14, 0]
+    gripper_init_qpos = [0, 0, 0, 0, 0, 0]
+    robot.set_qpos(arm_zero_qpos + gripper_init_qpos)
+    arm_target_qpos = [4.71, 2.84, 0.0, 0.75, 4.62, 4.48, 4.88]
+    target_qpos = arm_target_qpos + gripper_init_qpos
+
+    runner = SubstepRunner(scene)
+    runner.add_controller(GravityCompensation(robot, update_every=args.compensation_every))
+    pid = runner.add_controller(JointPID(
+        robot,
+        kp=[40, 40, 40, 20, 5, 5, 5] + [0.1] * 6,
+        ki=[5, 5, 5, 5, 0.8, 0.8, 0.8] + [0] * 6,
+        kd=[2, 2, 2, 2, 2, 2, 0.4] + [0.02] * 6,
+        integral_limit=1.0,
+    ))
+    pid.set_target(target_qpos)
+
+    pacer = RealtimePacer(physics_rate=1 / scene.get_timestep(), display_rate=60, report_interval=5.0)
+    while not viewer.closed:
+        runner.step(pacer.substeps())
+        pacer.substeps_done()
+        scene.update_render()
+        viewer.render()
+        pacer.frame_done()
+
+
+if __name__ == "__main__":
+    main()